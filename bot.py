@@ -1,15 +1,59 @@
 import os
+import asyncio
+import hashlib
+import sqlite3
 import logging
-import requests
+import queue
+import re
+import time
+from bisect import bisect_right
+from itertools import accumulate, islice
+import atexit
+from logging.handlers import MemoryHandler, QueueHandler, QueueListener
+import httpx
 import json
 import io
-import numpy as np
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-from datetime import datetime, timedelta
+from collections import deque
+from datetime import date, datetime, timedelta
+from urllib.parse import quote
 from dotenv import load_dotenv
+
+# Redis is optional; sessions fall back to in-process storage without it
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# orjson parses API payloads several times faster than stdlib json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# uvloop (Linux/macOS only) is a drop-in libuv event loop that handles the
+# bot's await-heavy handler traffic with much less overhead than the default
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+def json_loads(payload):
+    """Parse JSON bytes/str with orjson when available, stdlib otherwise."""
+    if orjson:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+def json_dumps(obj):
+    """Serialize to JSON with orjson when available, stdlib otherwise.
+
+    Returns bytes under orjson and str under stdlib; both are accepted by
+    the Redis client, which is the only consumer.
+    """
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj)
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import RetryAfter
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler, ContextTypes, 
     filters, CallbackQueryHandler, ConversationHandler
@@ -23,7 +67,11 @@ log_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
 os.makedirs(log_dir, exist_ok=True)
 log_file = os.path.join(log_dir, 'bot.log')
 
-# Create a file handler that logs even debug messages
+# Log level is configurable via LOG_LEVEL; INFO by default so debug records
+# are rejected before any formatting work happens in production
+LOG_LEVEL = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+
+# Create a file handler that logs everything the root logger lets through
 file_handler = logging.FileHandler(log_file)
 file_handler.setLevel(logging.DEBUG)
 
@@ -36,12 +84,35 @@ formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(messag
 file_handler.setFormatter(formatter)
 console_handler.setFormatter(formatter)
 
-# Configure root logger
-logging.basicConfig(
-    level=logging.DEBUG,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[file_handler, console_handler]
-)
+# Route records through a queue so handlers do their file/console I/O on a
+# background listener thread instead of blocking the event loop
+log_queue = queue.SimpleQueue()
+
+# The QueueHandler must pass records through unformatted, or its prepare()
+# bakes a formatted line into record.msg and the listener-side handlers
+# format it a second time. basicConfig always attaches a formatter (the
+# default one when format= is omitted), so configure the root logger by
+# hand with a message-only pass-through formatter instead.
+_queue_handler = QueueHandler(log_queue)
+_queue_handler.setFormatter(logging.Formatter('%(message)s'))
+_root_logger = logging.getLogger()
+_root_logger.setLevel(LOG_LEVEL)
+_root_logger.addHandler(_queue_handler)
+
+# Buffer file writes so records hit disk in batches of up to 200 (flushing
+# immediately on ERROR) instead of one write syscall per record
+buffered_file_handler = MemoryHandler(200, flushLevel=logging.ERROR, target=file_handler)
+buffered_file_handler.setLevel(logging.DEBUG)
+
+log_listener = QueueListener(log_queue, buffered_file_handler, console_handler, respect_handler_level=True)
+log_listener.start()
+
+def _shutdown_logging():
+    """Flush buffered records and stop the listener thread on exit."""
+    log_listener.stop()
+    buffered_file_handler.close()
+
+atexit.register(_shutdown_logging)
 
 logger = logging.getLogger(__name__)
 logger.info("Logger initialized")
@@ -60,157 +131,257 @@ else:
     MANHEIM_BASE_URL = "https://api.manheim.com"
     MANHEIM_TOKEN_URL = "https://api.manheim.com/oauth2/token"
 
-MANHEIM_VALUATIONS_URL = f"{MANHEIM_BASE_URL}/valuations/vin/{{vin}}"
-MANHEIM_YMM_URL = f"{MANHEIM_BASE_URL}/valuations/years/{{year}}/makes/{{make}}/models/{{model}}"
+def vin_valuation_url(vin, subseries=None, transmission=None):
+    """Build the VIN valuation endpoint URL with f-strings (no template re-parse)."""
+    url = f"{MANHEIM_BASE_URL}/valuations/vin/{vin}"
+    if subseries:
+        url = f"{url}/{subseries}"
+        if transmission:
+            url = f"{url}/{transmission}"
+    return url
+
+def ymm_valuation_url(year, make, model):
+    """Build the Year/Make/Model valuation endpoint URL."""
+    return f"{MANHEIM_BASE_URL}/valuations/years/{year}/makes/{make}/models/{model}"
+
+# Shared async HTTP client so Manheim calls never block the bot's event loop
+# and concurrent users multiplex over pooled keep-alive (HTTP/2) connections
+CLIENT = httpx.AsyncClient(
+    http2=True,
+    limits=httpx.Limits(max_keepalive_connections=16, max_connections=32),
+    timeout=httpx.Timeout(10.0, connect=3.05),
+    headers={"Accept": "application/json"}
+)
+
+# Transient upstream failures worth retrying at the HTTP layer
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+RETRY_TOTAL = 3
+RETRY_BACKOFF = 0.3
+
+async def request_with_retry(method, url, **kwargs):
+    """Issue a request on the shared client, retrying transient failures.
+
+    Retries transport errors and 429/5xx responses with exponential backoff,
+    honoring a numeric Retry-After header when Manheim sends one. The final
+    attempt is left to the caller's normal error handling.
+    """
+    delay = RETRY_BACKOFF
+    for attempt in range(RETRY_TOTAL):
+        try:
+            response = await CLIENT.request(method, url, **kwargs)
+        except httpx.TransportError as e:
+            logger.warning("Transient transport error calling Manheim (%s), retrying", e)
+        else:
+            if response.status_code not in RETRY_STATUS_CODES:
+                return response
+            logger.warning("Manheim returned %s, retrying", response.status_code)
+            retry_after = response.headers.get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                delay = max(delay, int(retry_after))
+        await asyncio.sleep(delay)
+        delay *= 2
+    return await CLIENT.request(method, url, **kwargs)
 
 # Token storage
-token_data = {
-    "access_token": None,
-    "expires_at": None
-}
+class TokenCache:
+    """OAuth token cache with fresh/stale/expired states.
 
-def get_manheim_token():
-    """Get a new OAuth token for Manheim API access."""
-    global token_data
-    
+    A token counts as stale a few minutes before it actually expires so a
+    background refresh can be kicked off while user commands keep using the
+    still-valid token. Only a fully expired token blocks the caller.
+    """
+    STALE_MARGIN = timedelta(minutes=3)
+
+    def __init__(self):
+        self.access_token = None
+        self.expires_at = None
+        self.stale_at = None
+        self.lock = asyncio.Lock()
+        self.refresh_task = None
+
+    def store(self, access_token, expires_in_seconds):
+        """Store a freshly obtained token and compute its state boundaries."""
+        now = datetime.now()
+        self.access_token = access_token
+        self.expires_at = now + timedelta(seconds=expires_in_seconds)
+        self.stale_at = self.expires_at - self.STALE_MARGIN
+
+    @property
+    def state(self):
+        """Return 'fresh', 'stale' or 'expired' for the current token."""
+        if not self.access_token or datetime.now() >= self.expires_at:
+            return "expired"
+        if datetime.now() >= self.stale_at:
+            return "stale"
+        return "fresh"
+
+token_cache = TokenCache()
+
+async def _refresh_manheim_token():
+    """Fetch a new OAuth token from Manheim, serialized by the cache lock."""
+    async with token_cache.lock:
+        # Another coroutine may have refreshed while we waited on the lock
+        if token_cache.state == "fresh":
+            return token_cache.access_token
+
+        headers = {
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+
+        data = {
+            "grant_type": "client_credentials",
+            "client_id": MANHEIM_CLIENT_ID,
+            "client_secret": MANHEIM_CLIENT_SECRET
+        }
+
+        try:
+            logger.info("Requesting new Manheim API token")
+            response = await request_with_retry("POST", MANHEIM_TOKEN_URL, headers=headers, data=data)
+            if response.status_code >= 400:
+                logger.error("HTTP error from Manheim API: %s - %s",
+                             response.status_code, response.text)
+                return None
+
+            token_info = json_loads(response.content)
+            if "access_token" not in token_info:
+                logger.error("No access_token in Manheim API response")
+                return None
+
+            # Expiry is typically 1 hour; shave a minute so we never present
+            # a token that dies mid-request
+            expires_in_seconds = token_info.get("expires_in", 3600) - 60
+            token_cache.store(token_info["access_token"], expires_in_seconds)
+
+            logger.info("Successfully obtained new Manheim API token")
+            return token_cache.access_token
+
+        except httpx.TimeoutException:
+            logger.error("Timeout while connecting to Manheim API for token")
+            return None
+        except httpx.TransportError:
+            logger.error("Connection error while connecting to Manheim API")
+            return None
+        except Exception as e:
+            logger.error("Error getting Manheim token: %s", e)
+            return None
+
+async def get_manheim_token():
+    """Get an OAuth token for Manheim API access.
+
+    Fresh tokens are returned immediately; stale tokens are returned while a
+    background refresh runs; only an expired token awaits the refresh inline.
+    """
     # Check if credentials are properly configured
     if not MANHEIM_CLIENT_ID or not MANHEIM_CLIENT_SECRET:
         logger.error("Manheim API credentials not properly configured")
         return None
-    
-    # Check if we have a valid token
-    now = datetime.now()
-    if (token_data["access_token"] and token_data["expires_at"] 
-            and now < token_data["expires_at"]):
-        return token_data["access_token"]
-    
-    # Request new token
-    headers = {
-        "Content-Type": "application/x-www-form-urlencoded"
-    }
-    
-    data = {
-        "grant_type": "client_credentials",
-        "client_id": MANHEIM_CLIENT_ID,
-        "client_secret": MANHEIM_CLIENT_SECRET
-    }
-    
-    try:
-        logger.info("Requesting new Manheim API token")
-        response = requests.post(MANHEIM_TOKEN_URL, headers=headers, data=data, timeout=10)
-        response.raise_for_status()
-        
-        token_info = response.json()
-        if "access_token" not in token_info:
-            logger.error("No access_token in Manheim API response")
-            return None
-            
-        token_data["access_token"] = token_info["access_token"]
-        # Set expiry time (typically 1 hour, but subtract 5 minutes for safety)
-        expires_in_seconds = token_info.get("expires_in", 3600) - 300
-        token_data["expires_at"] = now + timedelta(seconds=expires_in_seconds)
-        
-        logger.info("Successfully obtained new Manheim API token")
-        return token_data["access_token"]
-    
-    except requests.exceptions.Timeout:
-        logger.error("Timeout while connecting to Manheim API for token")
-        return None
-    except requests.exceptions.ConnectionError:
-        logger.error("Connection error while connecting to Manheim API")
-        return None
-    except requests.exceptions.HTTPError as e:
-        logger.error(f"HTTP error from Manheim API: {e.response.status_code} - {e.response.text}")
-        return None
-    except Exception as e:
-        logger.error(f"Error getting Manheim token: {e}")
-        return None
+
+    state = token_cache.state
+    if state == "fresh":
+        return token_cache.access_token
+
+    if state == "stale":
+        # Serve the still-valid token and renew proactively in the background
+        if token_cache.refresh_task is None or token_cache.refresh_task.done():
+            token_cache.refresh_task = asyncio.create_task(_refresh_manheim_token())
+        return token_cache.access_token
+
+    # Expired: the caller has to wait for the refresh
+    return await _refresh_manheim_token()
+
+# Static command replies, assembled once at import time
+START_TEXT = (
+    "🚘 *Welcome to Vehicle Auction Bot!*\n\n"
+    "*Available commands:*\n"
+    "• `/vin [VIN]` - Get auction data for a VIN\n"
+    "• `/ymm [Year] [Make] [Model]` - Get data by Year/Make/Model\n"
+    "• `/history` - View your recent lookups\n\n"
+    "Type `/help` for detailed examples and advanced options"
+)
+
+HELP_TEXT = (
+    "🚘 *Vehicle Auction Bot - Help Guide*\n\n"
+    "*VIN Lookup Options:*\n"
+    "• Basic: `/vin 1HGCM82633A123456`\n"
+    "• With subseries: `/vin 1HGCM82633A123456 SE`\n"
+    "• With subseries & transmission: `/vin 1HGCM82633A123456 SE AUTO`\n"
+    "• Advanced: `/vin WBA3C1C5XFP853102 color=WHITE grade=3.5 odometer=20000 region=NE`\n"
+    "• Historical: `/vin 1HGCM82633A123456 date=2023-10-15`\n\n"
+        
+    "*Parameter Options:*\n"
+    "• `color` - WHITE, BLACK, SILVER, etc.\n"
+    "• `grade` - 1.0 to 5.0 (condition grade)\n"
+    "• `odometer` - Mileage in miles\n"
+    "• `region` - NE, SE, MW, SW, W\n"
+    "• `date` - YYYY-MM-DD format (historical valuation)\n\n"
+        
+    "*Year/Make/Model Lookup:*\n"
+    "• `/ymm 2020 Honda Accord`\n"
+    "• With date: `/ymm 2020 Honda Accord date=2023-05-01`\n\n"
+        
+    "*History and Previous Lookups:*\n"
+    "• `/history` - View your 10 most recent lookups\n"
+    "• `/history VIN` - View only VIN lookups\n"
+    "• `/history YMM` - View only Year/Make/Model lookups\n\n"
+        
+    "*Interactive Features:*\n"
+    "• 📈 *Price Trend Charts* - Generate visual price trends for any vehicle\n"
+    "• 🔍 *Transaction Filtering* - Filter auction data by grade, mileage, and date\n"
+    "• 📄 *Pagination* - Navigate through large data sets with page controls\n\n"
+        
+    "*Testing Example:*\n"
+    "• Test VIN (UAT): `WBA3C1C5XFP853102`\n\n"
+        
+    "💡 After a search, use the interactive 'Refine Valuation' button to adjust parameters with a user-friendly interface.\n"
+    "💡 Date lookups show how vehicle values change over time. Dates must be after 2018-10-08."
+)
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /start is issued."""
-    await update.message.reply_text(
-        "🚘 *Welcome to Vehicle Auction Bot!*\n\n"
-        "*Available commands:*\n"
-        "• `/vin [VIN]` - Get auction data for a VIN\n"
-        "• `/ymm [Year] [Make] [Model]` - Get data by Year/Make/Model\n"
-        "• `/history` - View your recent lookups\n\n"
-        "Type `/help` for detailed examples and advanced options",
-        parse_mode="Markdown"
-    )
+    await update.message.reply_text(START_TEXT, parse_mode="Markdown")
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Send a message when the command /help is issued."""
-    await update.message.reply_text(
-        "🚘 *Vehicle Auction Bot - Help Guide*\n\n"
-        "*VIN Lookup Options:*\n"
-        "• Basic: `/vin 1HGCM82633A123456`\n"
-        "• With subseries: `/vin 1HGCM82633A123456 SE`\n"
-        "• With subseries & transmission: `/vin 1HGCM82633A123456 SE AUTO`\n"
-        "• Advanced: `/vin WBA3C1C5XFP853102 color=WHITE grade=3.5 odometer=20000 region=NE`\n"
-        "• Historical: `/vin 1HGCM82633A123456 date=2023-10-15`\n\n"
-        
-        "*Parameter Options:*\n"
-        "• `color` - WHITE, BLACK, SILVER, etc.\n"
-        "• `grade` - 1.0 to 5.0 (condition grade)\n"
-        "• `odometer` - Mileage in miles\n"
-        "• `region` - NE, SE, MW, SW, W\n"
-        "• `date` - YYYY-MM-DD format (historical valuation)\n\n"
-        
-        "*Year/Make/Model Lookup:*\n"
-        "• `/ymm 2020 Honda Accord`\n"
-        "• With date: `/ymm 2020 Honda Accord date=2023-05-01`\n\n"
-        
-        "*History and Previous Lookups:*\n"
-        "• `/history` - View your 10 most recent lookups\n"
-        "• `/history VIN` - View only VIN lookups\n"
-        "• `/history YMM` - View only Year/Make/Model lookups\n\n"
-        
-        "*Interactive Features:*\n"
-        "• 📈 *Price Trend Charts* - Generate visual price trends for any vehicle\n"
-        "• 🔍 *Transaction Filtering* - Filter auction data by grade, mileage, and date\n"
-        "• 📄 *Pagination* - Navigate through large data sets with page controls\n\n"
-        
-        "*Testing Example:*\n"
-        "• Test VIN (UAT): `WBA3C1C5XFP853102`\n\n"
-        
-        "💡 After a search, use the interactive 'Refine Valuation' button to adjust parameters with a user-friendly interface.\n"
-        "💡 Date lookups show how vehicle values change over time. Dates must be after 2018-10-08.",
-        parse_mode="Markdown"
-    )
+    await update.message.reply_text(HELP_TEXT, parse_mode="Markdown")
+
+# Valid VIN alphabet: alphanumeric minus I, O and Q (easily confused)
+_VIN_RE = re.compile(r"[A-HJ-NPR-Z0-9]{17}")
 
 def validate_vin(vin):
     """
     Validate a Vehicle Identification Number (VIN)
-    
+
     Args:
         vin (str): The VIN to validate
-        
+
     Returns:
         tuple: (bool, str) whether valid and error message if not
     """
     if not vin:
         return False, "VIN cannot be empty"
-    
+
     # VINs should be 17 characters for modern vehicles (since 1981)
     if len(vin) != 17:
         return False, "VIN must be exactly 17 characters"
-    
-    # VINs should be alphanumeric and not contain I, O, or Q to avoid confusion
-    invalid_chars = set(c for c in vin if not c.isalnum() or c in "IOQ")
-    if invalid_chars:
+
+    # One C-level regex pass covers the alphabet check; the per-character
+    # scan only runs on the failure path to build the error message
+    if not _VIN_RE.fullmatch(vin):
+        invalid_chars = set(c for c in vin if not c.isalnum() or c in "IOQ")
         return False, f"VIN contains invalid characters: {', '.join(invalid_chars)}"
-    
+
     return True, ""
 
-def get_vin_valuation(vin, subseries=None, transmission=None, **query_params):
+async def get_vin_valuation(vin, subseries=None, transmission=None, validate=True, **query_params):
     """
     Get valuation data for a specific VIN from Manheim API.
-    
+
     Args:
         vin (str): The Vehicle Identification Number
         subseries (str, optional): Vehicle subseries for more specific valuation
         transmission (str, optional): Transmission type for more specific valuation
                                      (requires subseries to be specified)
+        validate (bool): Skip VIN re-validation when the caller already did it
         **query_params: Additional query parameters such as:
             - color (str): Vehicle color (e.g., "WHITE", "BLACK")
             - grade (float/str): Vehicle condition grade (e.g., "3.5", "4.0")
@@ -221,167 +392,730 @@ def get_vin_valuation(vin, subseries=None, transmission=None, **query_params):
     Returns:
         dict: Valuation data or None if not found/error
     """
-    # Validate VIN
-    is_valid, error_msg = validate_vin(vin)
-    if not is_valid:
-        logger.error(f"Invalid VIN: {error_msg} - {vin}")
-        return None
-    
-    # Validate query parameters
-    valid_regions = {"NE", "SE", "MW", "SW", "W"}
-    if "region" in query_params and query_params["region"] not in valid_regions:
-        logger.warning(f"Invalid region: {query_params['region']}. Must be one of {valid_regions}")
-        query_params["region"] = None
-        
-    # Validate date parameter
-    if "date" in query_params:
-        date_str = query_params["date"]
-        try:
-            # Check if date is in correct format
-            datetime.strptime(date_str, "%Y-%m-%d")
-            
-            # Check if date is after minimum allowed date (2018-10-08)
-            min_date = datetime.strptime("2018-10-08", "%Y-%m-%d")
-            requested_date = datetime.strptime(date_str, "%Y-%m-%d")
-            
-            if requested_date < min_date:
-                logger.warning(f"Date too early: {date_str}. Must be on or after 2018-10-08")
-                query_params["date"] = None
-                
-            # Check if date is in the future
-            today = datetime.now()
-            if requested_date > today:
-                logger.warning(f"Future date: {date_str}. Must be on or before today's date")
-                query_params["date"] = None
-                
-        except ValueError:
-            logger.warning(f"Invalid date format: {date_str}. Must be in YYYY-MM-DD format")
-            query_params["date"] = None
-    
-    if "grade" in query_params:
-        try:
-            grade_value = query_params["grade"]
-            
-            # Handle different grade formats
-            if isinstance(grade_value, (int, float)):
-                # If already a number, check if it's using the API format (10-50) or decimal format (1.0-5.0)
-                if grade_value > 5 and grade_value <= 50:
-                    # Already in API format (10-50)
-                    if not 10 <= grade_value <= 50:
-                        logger.warning(f"Grade out of range: {grade_value}. Must be between 10 and 50")
-                        query_params["grade"] = None
-                else:
-                    # In decimal format (1.0-5.0), convert to API format (10-50)
-                    if not 0 <= grade_value <= 5:
-                        logger.warning(f"Grade out of range: {grade_value}. Must be between 0 and 5")
-                        query_params["grade"] = None
-                    else:
-                        # Convert to API integer format
-                        query_params["grade"] = int(grade_value * 10)
-            else:
-                # Try to convert string to number
-                float_grade = float(grade_value)
-                if float_grade > 5 and float_grade <= 50:
-                    # Already in API format (10-50)
-                    query_params["grade"] = int(float_grade)
-                else:
-                    # Convert from decimal (1.0-5.0) to API format (10-50)
-                    if 0 <= float_grade <= 5:
-                        query_params["grade"] = int(float_grade * 10)
-                    else:
-                        logger.warning(f"Grade out of range: {float_grade}. Must be between 0 and 5")
-                        query_params["grade"] = None
-                        
-        except (ValueError, TypeError):
-            logger.warning(f"Invalid grade value: {query_params['grade']}")
-            query_params["grade"] = None
-    
-    if "odometer" in query_params:
-        try:
-            # Ensure odometer is a positive integer
-            odometer = int(query_params["odometer"])
-            if odometer < 0:
-                logger.warning(f"Negative odometer value: {odometer}")
-                query_params["odometer"] = None
-            elif odometer > 999999:
-                logger.warning(f"Unrealistic odometer value: {odometer}")
-                query_params["odometer"] = None
-            else:
-                query_params["odometer"] = odometer
-        except (ValueError, TypeError):
-            logger.warning(f"Invalid odometer value: {query_params['odometer']}")
-            query_params["odometer"] = None
-    
+    # Validate the VIN and normalize parameters unless the caller already
+    # did both; vin_command validates its keywords up front and the refine
+    # flow normalizes its session params before calling, so the common path
+    # skips this entirely instead of paying for validation twice
+    if validate:
+        is_valid, error_msg = validate_vin(vin)
+        if not is_valid:
+            logger.error("Invalid VIN: %s - %s", error_msg, vin)
+            return None
+
+        _normalize_vin_params(query_params)
+
+    # Invalid values were popped above, so query_params can be passed on
+    # as-is with no rebuild; it is our own kwargs dict
+    params = query_params
+
+    # Serve repeated queries from the short-TTL cache
+    cache_key = ValuationCache.make_key(
+        "vin", vin, subseries, transmission, json.dumps(params, sort_keys=True)
+    )
+    cached = await valuation_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Valuation cache hit for VIN: %s", vin)
+        return cached
+
+    # Coalesce concurrent identical lookups into a single upstream call;
+    # followers await the leader's future instead of hitting the API
+    loop = asyncio.get_running_loop()
+    async with _inflight_lock:
+        existing = _inflight.get(cache_key)
+        if existing is None:
+            _inflight[cache_key] = loop.create_future()
+    if existing is not None:
+        return await existing
+
+    try:
+        data = await _fetch_vin_valuation(vin, subseries, transmission, params, cache_key)
+        _inflight[cache_key].set_result(data)
+        return data
+    except BaseException as e:
+        _inflight[cache_key].set_exception(e)
+        raise
+    finally:
+        async with _inflight_lock:
+            _inflight.pop(cache_key, None)
+
+async def _fetch_vin_valuation(vin, subseries, transmission, params, cache_key):
+    """Perform the actual Manheim VIN valuation request (singleflight leader)."""
     # Get authentication token
-    token = get_manheim_token()
+    token = await get_manheim_token()
     if not token:
         logger.error("Failed to get authentication token")
         return None
-    
+
     # Construct URL based on provided parameters
-    if subseries and transmission:
-        url = f"{MANHEIM_VALUATIONS_URL.format(vin=vin)}/{subseries}/{transmission}"
-    elif subseries:
-        url = f"{MANHEIM_VALUATIONS_URL.format(vin=vin)}/{subseries}"
-    else:
-        url = MANHEIM_VALUATIONS_URL.format(vin=vin)
+    url = vin_valuation_url(vin, subseries, transmission)
     
     headers = {
         "Authorization": f"Bearer {token}",
         "Accept": "application/json"
     }
-    
-    # Filter out None values from query parameters
-    params = {k: v for k, v in query_params.items() if v is not None}
-    
+
     try:
-        logger.info(f"Fetching valuation data for VIN: {vin}")
-        response = requests.get(url, headers=headers, params=params, timeout=15)
-        response.raise_for_status()
-        
-        data = response.json()
-        
+        logger.info("Fetching valuation data for VIN: %s", vin)
+        response = await request_with_retry("GET", url, headers=headers, params=params)
+
+        # Branch on the status code directly; 404 is the routine
+        # "no data for this VIN" outcome and should not pay for
+        # raising and catching an exception
+        status = response.status_code
+        if status == 404:
+            logger.warning("No data found for VIN: %s", vin)
+            return None
+        if status >= 400:
+            logger.error("HTTP error fetching VIN data: %s - %s", status, response.text)
+            return None
+
+        data = json_loads(response.content)
+
         # Validate response data
         if not data:
-            logger.warning(f"Empty response for VIN: {vin}")
+            logger.warning("Empty response for VIN: %s", vin)
             return None
             
         # Check if the response has the expected structure
         if "vehicle" not in data:
-            logger.warning(f"Unexpected API response format for VIN: {vin} - missing vehicle data")
+            logger.warning("Unexpected API response format for VIN: %s - missing vehicle data", vin)
             
-        logger.info(f"Successfully retrieved valuation data for VIN: {vin}")
+        logger.info("Successfully retrieved valuation data for VIN: %s", vin)
+        # Cache only the rendered fields; large unrendered blobs would just
+        # inflate the cache's memory footprint
+        await valuation_cache.set(cache_key, trim_valuation(data))
         return data
         
-    except requests.exceptions.Timeout:
-        logger.error(f"Timeout while fetching data for VIN: {vin}")
+    except httpx.TimeoutException:
+        logger.error("Timeout while fetching data for VIN: %s", vin)
         return None
-    except requests.exceptions.ConnectionError:
-        logger.error(f"Connection error while fetching data for VIN: {vin}")
+    except httpx.TransportError:
+        logger.error("Connection error while fetching data for VIN: %s", vin)
         return None
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
-            logger.warning(f"No data found for VIN: {vin}")
-            return None
-        logger.error(f"HTTP error fetching VIN data: {e.response.status_code} - {e.response.text}")
-        return None
-    except json.JSONDecodeError:
-        logger.error(f"Invalid JSON response for VIN: {vin}")
+    except ValueError:
+        logger.error("Invalid JSON response for VIN: %s", vin)
         return None
     except Exception as e:
-        logger.error(f"Error fetching VIN data: {e}")
+        logger.error("Error fetching VIN data: %s", e)
         return None
 
 # State definitions for conversation
 CHOOSING_COLOR, CHOOSING_GRADE, CHOOSING_ODOMETER, CHOOSING_REGION = range(4)
 
-# Data storage for conversation context and history
-user_data_dict = {}
+# Callback-data patterns, compiled once and shared with the handler registry
+CB_REFINE = re.compile(r"^refine_valuation$")
+CB_COLOR = re.compile(r"^color_")
+CB_GRADE = re.compile(r"^grade_")
+CB_ODOMETER = re.compile(r"^odometer_")
+CB_REGION = re.compile(r"^region_")
+CB_CANCEL = re.compile(r"^cancel$")
+CB_VIEW_TRANSACTIONS = re.compile(r"^view_all_transactions")
+CB_PAGE = re.compile(r"^page:")
+CB_CHART = re.compile(r"^generate_chart:")
+
+# The refinement menus never change, so build their keyboards once at import
+REFINE_COLORS = ["BLACK", "WHITE", "SILVER", "GRAY", "RED", "BLUE", "BROWN", "GREEN", "GOLD", "OTHER"]
+REFINE_GRADES = ["1.0", "1.5", "2.0", "2.5", "3.0", "3.5", "4.0", "4.5", "5.0"]
+REFINE_ODOMETERS = [5000, 20000, 45000, 80000, 125000, 175000]
+REFINE_REGIONS = ["NE", "SE", "MW", "SW", "W"]
+
+# Lookup tables from callback data to the selected value, so the selection
+# handlers do a dict lookup instead of splitting strings per click.
+# "region_skip" is intentionally absent and maps to None via .get()
+COLOR_BY_CALLBACK = {f"color_{color}": color for color in REFINE_COLORS}
+GRADE_BY_CALLBACK = {f"grade_{grade}": float(grade) for grade in REFINE_GRADES}
+ODOMETER_BY_CALLBACK = {f"odometer_{miles}": miles for miles in REFINE_ODOMETERS}
+REGION_BY_CALLBACK = {f"region_{region}": region for region in REFINE_REGIONS}
+
+# Buttons that appear on many keyboards are shared single instances
+CANCEL_BUTTON = InlineKeyboardButton("❌ Cancel", callback_data="cancel")
+CLOSE_BUTTON = InlineKeyboardButton("Close", callback_data="cancel")
+CLEAR_FILTERS_BUTTON = InlineKeyboardButton("❌ Clear Filters", callback_data="view_all_transactions")
+REFINE_BUTTON = InlineKeyboardButton("🔄 Refine Valuation", callback_data="refine_valuation")
+
+COLOR_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(color, callback_data=f"color_{color}")] for color in REFINE_COLORS]
+    + [[CANCEL_BUTTON]]
+)
+
+GRADE_KEYBOARD = InlineKeyboardMarkup(
+    [[InlineKeyboardButton(f"Grade {grade}", callback_data=f"grade_{grade}")] for grade in REFINE_GRADES]
+    + [[CANCEL_BUTTON]]
+)
+
+ODOMETER_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("< 10,000", callback_data="odometer_5000"),
+        InlineKeyboardButton("10-30k", callback_data="odometer_20000")
+    ],
+    [
+        InlineKeyboardButton("30-60k", callback_data="odometer_45000"),
+        InlineKeyboardButton("60-100k", callback_data="odometer_80000")
+    ],
+    [
+        InlineKeyboardButton("100-150k", callback_data="odometer_125000"),
+        InlineKeyboardButton("> 150k", callback_data="odometer_175000")
+    ],
+    [CANCEL_BUTTON]
+])
+
+REGION_KEYBOARD = InlineKeyboardMarkup([
+    [
+        InlineKeyboardButton("Northeast (NE)", callback_data="region_NE"),
+        InlineKeyboardButton("Southeast (SE)", callback_data="region_SE")
+    ],
+    [
+        InlineKeyboardButton("Midwest (MW)", callback_data="region_MW"),
+        InlineKeyboardButton("Southwest (SW)", callback_data="region_SW")
+    ],
+    [
+        InlineKeyboardButton("West (W)", callback_data="region_W"),
+        InlineKeyboardButton("Skip", callback_data="region_skip")
+    ],
+    [CANCEL_BUTTON]
+])
+
+# Session storage for conversation context
+SESSION_TTL_SECONDS = 900  # 15 minutes
+
+class SessionStore:
+    """Per-user session storage with automatic expiry.
+
+    Uses Redis when REDIS_URL is configured, which bounds memory via TTL and
+    allows running more than one bot worker. Without Redis it falls back to
+    an in-process dict with the same expiry semantics, so abandoned
+    conversations no longer leak response blobs forever.
+    """
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS):
+        self.ttl = ttl
+        self.redis = None
+        redis_url = os.getenv("REDIS_URL")
+        if redis_url and aioredis:
+            try:
+                self.redis = aioredis.from_url(redis_url)
+                logger.info("Session store using Redis backend")
+            except Exception as e:
+                logger.error("Could not connect to Redis, using in-memory sessions: %s", e)
+        elif redis_url:
+            logger.warning("REDIS_URL is set but the redis package is not installed; using in-memory sessions")
+        self._local = {}
+        self._locks = {}
+
+    def lock(self, user_id):
+        """Per-user lock serializing read-modify-write session updates.
+
+        With concurrent updates enabled, two callbacks for the same user can
+        interleave across the await between get() and set() and lose one
+        write; holding this lock around the read-modify-write closes that
+        window. The registry is pruned once it outgrows the session count.
+        """
+        lock = self._locks.get(user_id)
+        if lock is None:
+            if len(self._locks) >= 10000:
+                # Drop locks nobody is holding; waiters keep theirs alive
+                self._locks = {uid: l for uid, l in self._locks.items() if l.locked()}
+            lock = self._locks.setdefault(user_id, asyncio.Lock())
+        return lock
+
+    async def get(self, user_id):
+        """Return the session payload for a user, or None if missing/expired."""
+        if self.redis:
+            try:
+                raw = await self.redis.get(f"sess:{user_id}")
+                return json_loads(raw) if raw else None
+            except Exception as e:
+                logger.error("Redis session read failed: %s", e)
+                return None
+        entry = self._local.get(user_id)
+        if not entry:
+            return None
+        payload, expires_at = entry
+        if datetime.now() >= expires_at:
+            del self._local[user_id]
+            return None
+        return payload
+
+    async def set(self, user_id, payload):
+        """Store the session payload for a user, refreshing its TTL."""
+        if self.redis:
+            try:
+                await self.redis.set(f"sess:{user_id}", json_dumps(payload), ex=self.ttl)
+                return
+            except Exception as e:
+                logger.error("Redis session write failed: %s", e)
+        self._local[user_id] = (payload, datetime.now() + timedelta(seconds=self.ttl))
+
+    async def delete(self, user_id):
+        """Drop the session for a user."""
+        if self.redis:
+            try:
+                await self.redis.delete(f"sess:{user_id}")
+                return
+            except Exception as e:
+                logger.error("Redis session delete failed: %s", e)
+        self._local.pop(user_id, None)
+
+sessions = SessionStore()
+
+# Valuation response cache
+VALUATION_CACHE_TTL_SECONDS = 600  # 10 minutes
+
+class ValuationCache:
+    """Short-TTL cache for Manheim valuation responses.
+
+    Keys hash the normalized query, so repeated lookups for the same vehicle
+    (by any user) are served without another API round-trip. Shares the
+    session store's Redis connection when one is configured, otherwise keeps
+    entries in process memory with the same expiry.
+    """
+
+    def __init__(self, ttl=VALUATION_CACHE_TTL_SECONDS):
+        self.ttl = ttl
+        self._local = {}
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash the composite query parts into a short, stable cache key."""
+        raw = "|".join(str(p) for p in parts)
+        return "mh:" + hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+    async def get(self, key):
+        """Return the cached response for a key, or None on miss/expiry."""
+        if sessions.redis:
+            try:
+                raw = await sessions.redis.get(key)
+                return json_loads(raw) if raw else None
+            except Exception as e:
+                logger.error("Redis valuation cache read failed: %s", e)
+                return None
+        entry = self._local.get(key)
+        if not entry:
+            return None
+        payload, expires_at = entry
+        if datetime.now() >= expires_at:
+            del self._local[key]
+            return None
+        return payload
+
+    async def set(self, key, payload):
+        """Cache a response payload under a key with the configured TTL."""
+        if sessions.redis:
+            try:
+                await sessions.redis.set(key, json_dumps(payload), ex=self.ttl)
+                return
+            except Exception as e:
+                logger.error("Redis valuation cache write failed: %s", e)
+        self._local[key] = (payload, datetime.now() + timedelta(seconds=self.ttl))
+
+valuation_cache = ValuationCache()
+
+# In-flight request deduplication: key -> Future shared by concurrent callers
+_inflight = {}
+_inflight_lock = asyncio.Lock()
+
+class TokenBucket:
+    """Async token bucket used to pace bursts of outbound Telegram messages.
+
+    Telegram enforces a ~30 messages/second global cap; exceeding it earns
+    429s and retry-after penalties, which cost far more than briefly waiting
+    for a send slot here.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Wait until a send slot is available, then consume one token."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def penalize(self, seconds):
+        """Empty the bucket and push the refill out, pausing all senders.
+
+        Called when Telegram answers with RetryAfter so every queued send
+        waits out the penalty window instead of piling on more 429s.
+        """
+        self.tokens = 0.0
+        self.updated = time.monotonic() + seconds
+
+# Global pacing for message bursts (pagination, transaction dumps); 28/s
+# leaves headroom under Telegram's ~30 messages/second bot-wide cap
+send_rate_limit = TokenBucket(rate=28, capacity=28)
+
+async def send_with_rate_limit(send, *args, **kwargs):
+    """Send through the token bucket, honoring RetryAfter penalties once."""
+    await send_rate_limit.acquire()
+    try:
+        return await send(*args, **kwargs)
+    except RetryAfter as e:
+        send_rate_limit.penalize(e.retry_after)
+        await asyncio.sleep(e.retry_after)
+        return await send(*args, **kwargs)
+
+# Display labels for extra transaction fields, precomputed from their
+# camelCase API keys so the hot formatting loop does no string munging
+TRANSACTION_FIELD_LABELS = {
+    "color": "Color",
+    "trim": "Trim",
+    "model": "Model",
+    "bodyStyle": "Body style",
+    "cylinder": "Cylinder",
+    "fuel": "Fuel",
+}
 
 # History cache to store previous lookups
-# Structure: {user_id: [{'type': 'vin|ymm', 'query': VIN or YMM dict, 'data': API response, 'timestamp': datetime}]}
+# Structure: {user_id: deque of {'type': 'vin|ymm', 'query': VIN or YMM dict,
+# 'data': API response, 'timestamp': datetime}}, most recent first
 history_cache = {}
 
+# Bounds so history memory stays flat regardless of traffic: each user keeps
+# the 10 most recent lookups, and inactive users are evicted once the cap on
+# tracked users is reached
+MAX_HISTORY_ENTRIES = 10
+MAX_HISTORY_USERS = 10000
+
+# Lookup history is also written through to sqlite so it survives restarts
+# and evicted users can be reloaded. WAL mode lets reads proceed during
+# writes; synchronous=NORMAL keeps inserts to a single sub-ms page write.
+HISTORY_DB_PATH = os.getenv("HISTORY_DB_PATH", "logs/history.db")
+_history_db = None
+
+def _get_history_db():
+    """Open (once) and return the sqlite history database."""
+    global _history_db
+    if _history_db is None:
+        os.makedirs(os.path.dirname(HISTORY_DB_PATH) or ".", exist_ok=True)
+        db = sqlite3.connect(HISTORY_DB_PATH, check_same_thread=False, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS history "
+            "(user_id INTEGER, ts REAL, entry TEXT)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS idx_history_user_ts ON history (user_id, ts DESC)")
+        _history_db = db
+    return _history_db
+
+def _user_history(user_id):
+    """Return the user's history deque, creating or LRU-refreshing it."""
+    history = history_cache.get(user_id)
+    if history is None:
+        if len(history_cache) >= MAX_HISTORY_USERS:
+            # dicts iterate in insertion order, so the first key is the
+            # least recently active user
+            history_cache.pop(next(iter(history_cache)))
+        history = deque(_load_history_rows(user_id), maxlen=MAX_HISTORY_ENTRIES)
+    else:
+        # Re-insert so active users migrate to the back of the dict
+        del history_cache[user_id]
+    history_cache[user_id] = history
+    return history
+
+def _load_history_rows(user_id):
+    """Fetch a user's persisted history entries, most recent first."""
+    try:
+        rows = _get_history_db().execute(
+            "SELECT ts, entry FROM history WHERE user_id = ? ORDER BY ts DESC LIMIT ?",
+            (user_id, MAX_HISTORY_ENTRIES)
+        ).fetchall()
+    except sqlite3.Error as e:
+        logger.error("Failed to load history for user %s: %s", user_id, e)
+        return []
+    entries = []
+    for ts, raw in rows:
+        try:
+            entry = json.loads(raw)
+        except ValueError:
+            continue
+        entry['timestamp'] = datetime.fromtimestamp(ts)
+        entries.append(entry)
+    return entries
+
+def _record_history(user_id, entry):
+    """Prepend an entry to the user's history and write it through to sqlite."""
+    _user_history(user_id).appendleft(entry)
+    ts = entry['timestamp'].timestamp()
+    raw = json.dumps({k: v for k, v in entry.items() if k != 'timestamp'}, default=str)
+    try:
+        db = _get_history_db()
+        db.execute("INSERT INTO history (user_id, ts, entry) VALUES (?, ?, ?)", (user_id, ts, raw))
+        # Keep only the most recent entries per user on disk as well
+        db.execute(
+            "DELETE FROM history WHERE user_id = ? AND ts NOT IN "
+            "(SELECT ts FROM history WHERE user_id = ? ORDER BY ts DESC LIMIT ?)",
+            (user_id, user_id, MAX_HISTORY_ENTRIES)
+        )
+    except sqlite3.Error as e:
+        logger.error("Failed to persist history entry for user %s: %s", user_id, e)
+
+# Only these top-level keys are ever rendered; anything else in the API
+# payload is dead weight once a response is kept in session or history
+VALUATION_KEEP_KEYS = (
+    "requestedDate", "vehicle", "adjustedPricing", "historicalAverages",
+    "forecast", "sampleSize", "extendedCoverage", "bestMatch", "marketSummary",
+)
+
+def trim_valuation(data):
+    """Strip unrendered fields from an API response before storing it."""
+    if not isinstance(data, dict):
+        return data
+    return {k: data[k] for k in VALUATION_KEEP_KEYS if k in data}
+
+_HISTORY_PERIOD_KEYS = ("last30days", "lastMonth", "lastSixMonths", "lastYear")
+
+def _norm_grade(value):
+    """Coerce a conditionGrade to the decimal 0-5 scale with a single cast."""
+    value = float(value)
+    return value / 10 if value > 5 else value
+
+def _filter_by_grade(value):
+    """Match transactions at or above a minimum condition grade."""
+    min_grade = float(value)
+    return (
+        f"(Grade ≥ {value})",
+        lambda tx: "conditionGrade" in tx and _norm_grade(tx["conditionGrade"]) >= min_grade,
+    )
+
+def _filter_by_odometer(value):
+    """Match transactions at or below a maximum mileage."""
+    max_miles = int(value)
+    return (
+        f"(Mileage ≤ {max_miles:,})",
+        lambda tx: "odometer" in tx and int(tx["odometer"]) <= max_miles,
+    )
+
+def _filter_by_date(value):
+    """Match transactions on or after an ISO date threshold."""
+    return (
+        f"(Date ≥ {value})",
+        lambda tx: "saleDate" in tx and tx["saleDate"][:10] >= value,
+    )
+
+def _filter_by_region(value):
+    """Match transactions in a region exactly."""
+    return (
+        f"(Region: {value})",
+        lambda tx: tx.get("region") == value,
+    )
+
+# Dispatch table for "view_all_transactions:<filter_type>:<value>" callbacks;
+# a single dict lookup replaces the if/elif chain per button press. Each
+# entry maps the raw filter value to (description, predicate) so callers
+# can count and slice matches lazily instead of materializing them all.
+TRANSACTION_FILTERS = {
+    "grade": _filter_by_grade,
+    "odometer": _filter_by_odometer,
+    "date": _filter_by_date,
+    "region": _filter_by_region,
+}
+
+def _format_transaction_detail(i, tx):
+    """Render one transaction's full detail block for the all-transactions view.
+
+    Each field is bound with a single .get instead of an "in" probe followed
+    by a second lookup, and the block is joined once.
+    """
+    lines = [f"*Transaction #{i}*\n"]
+
+    price = tx.get("price")
+    if price is not None:
+        lines.append(f"• *Price:* ${price:,.2f}\n")
+
+    sale_date = tx.get("saleDate")
+    if sale_date:
+        lines.append(f"• *Date:* {sale_date[:10]}\n")  # Format ISO date
+
+    odometer = tx.get("odometer")
+    if odometer is not None:
+        lines.append(f"• *Mileage:* {odometer:,} miles\n")
+
+    grade_value = tx.get("conditionGrade")
+    if grade_value is not None:
+        if isinstance(grade_value, (int, float)) and grade_value > 5:
+            grade_value = grade_value / 10.0
+        lines.append(f"• *Condition:* {grade_value}/5.0\n")
+
+    location = tx.get("location")
+    if location is not None:
+        lines.append(f"• *Location:* {location}\n")
+
+    lane = tx.get("lane")
+    if lane is not None:
+        lines.append(f"• *Lane:* {lane}\n")
+
+    seller = tx.get("sellerName")
+    if seller is not None:
+        lines.append(f"• *Seller:* {seller}\n")
+
+    # Add only important additional transaction details
+    for key, label in TRANSACTION_FIELD_LABELS.items():
+        value = tx.get(key)
+        if value:
+            lines.append(f"• *{label}:* {value}\n")
+
+    lines.append("\n")
+    return "".join(lines)
+
+# Relative-date thresholds for the filter buttons. They only shift once a
+# day, so recompute at most hourly instead of calling datetime.now() and
+# strftime on every render.
+_date_threshold_cache = {"value": None, "checked": 0.0}
+
+def _date_thresholds():
+    """Return (six_months_ago, one_year_ago) as ISO date strings."""
+    if (_date_threshold_cache["value"] is None
+            or time.monotonic() - _date_threshold_cache["checked"] > 3600):
+        today = date.today()
+        _date_threshold_cache["value"] = (
+            (today - timedelta(days=180)).isoformat(),
+            (today - timedelta(days=365)).isoformat(),
+        )
+        _date_threshold_cache["checked"] = time.monotonic()
+    return _date_threshold_cache["value"]
+
+def summarize_valuation(data):
+    """Return (transaction_count, has_historical) for a payload in one pass.
+
+    Replaces the chains of nested "key in dict" probes the handlers used to
+    run when deciding which keyboard options apply.
+    """
+    market = data.get("marketSummary") or {}
+    transactions = market.get("transactions") or ()
+    history = data.get("historicalAverages") or {}
+    has_historical = any("price" in (history.get(k) or {}) for k in _HISTORY_PERIOD_KEYS)
+    return len(transactions), has_historical
+
+# Per-key validators for /vin keyword arguments. Each returns
+# (parsed_value, warning): a warning means the argument is dropped and the
+# user is told why.
+VALID_REGIONS = frozenset({"NE", "SE", "MW", "SW", "W"})
+
+# Manheim has no valuation data before this date
+MIN_VALUATION_DATE = date(2018, 10, 8)
+
+def _parse_color_arg(value):
+    return value.upper(), None
+
+def _parse_grade_arg(value):
+    try:
+        float_value = float(value)
+    except ValueError:
+        return None, f"Invalid grade '{value}'. Must be a number between 0 and 5. Using default value."
+    if not 0 <= float_value <= 5:
+        return None, "Grade must be between 0 and 5. Using default value."
+    # Convert decimal grade (e.g., 3.5) to integer format (e.g., 35) for API
+    return int(float_value * 10), None
+
+def _parse_date_arg(value):
+    try:
+        requested_date = date.fromisoformat(value)
+    except ValueError:
+        return None, f"Invalid date format '{value}'. Must be in YYYY-MM-DD format. Using current date."
+    if requested_date < MIN_VALUATION_DATE:
+        return None, "Date must be on or after 2018-10-08. Using current date."
+    if requested_date > date.today():
+        return None, "Date cannot be in the future. Using current date."
+    return value, None
+
+def _parse_odometer_arg(value):
+    try:
+        miles = int(value)
+    except ValueError:
+        return None, f"Invalid mileage '{value}'. Must be a number. Using default value."
+    if miles < 0 or miles > 999999:
+        return None, "Invalid mileage value. Using default value."
+    return miles, None
+
+def _parse_region_arg(value):
+    value = value.upper()
+    if value not in VALID_REGIONS:
+        return None, f"Invalid region '{value}'. Must be one of: NE, SE, MW, SW, W. Using default value."
+    return value, None
+
+VIN_ARG_PARSERS = {
+    'color': _parse_color_arg,
+    'grade': _parse_grade_arg,
+    'date': _parse_date_arg,
+    'odometer': _parse_odometer_arg,
+    'region': _parse_region_arg,
+}
+
+def _normalize_vin_params(query_params):
+    """
+    Validate and convert VIN query parameters in place.
+
+    Runs the shared per-key parsers so range checks and format conversions
+    live in one place; invalid values are dropped with a warning. Grade is
+    special-cased because callers may pass either the decimal scale (0-5)
+    or the API's integer scale (10-50), which the shared parser rejects.
+
+    Returns:
+        dict: The same dict, normalized to API-ready values
+    """
+    for key in ("region", "date", "odometer"):
+        value = query_params.get(key)
+        if value is not None:
+            parsed, warning = VIN_ARG_PARSERS[key](str(value))
+            if warning:
+                logger.warning("Dropping invalid %s value %r: %s", key, value, warning)
+                query_params.pop(key)
+            else:
+                query_params[key] = parsed
+
+    if "grade" in query_params:
+        try:
+            float_grade = float(query_params["grade"])
+            if 5 < float_grade <= 50:
+                # Already in API format (10-50)
+                query_params["grade"] = int(float_grade)
+            elif 0 <= float_grade <= 5:
+                # Convert from decimal (1.0-5.0) to API format (10-50)
+                query_params["grade"] = int(float_grade * 10)
+            else:
+                logger.warning("Grade out of range: %s. Must be between 0 and 5", float_grade)
+                query_params.pop("grade")
+        except (ValueError, TypeError):
+            logger.warning("Invalid grade value: %s", query_params['grade'])
+            query_params.pop("grade")
+
+    return query_params
+
+# key=value command tokens; the key must look like an identifier so stray
+# '=' characters inside positional values are not misread as keywords
+_KV_RE = re.compile(r"([A-Za-z_][\w-]*)=(.*)", re.S)
+
+def parse_kv_args(args):
+    """
+    Split command arguments into positional and keyword form in one pass.
+
+    Args:
+        args (list): Raw argument tokens from the command
+
+    Returns:
+        tuple: (positional list, dict of lowercased key -> value)
+    """
+    positional = []
+    keywords = {}
+    for arg in args:
+        match = _KV_RE.fullmatch(arg)
+        if match:
+            keywords[match.group(1).lower()] = match.group(2)
+        else:
+            positional.append(arg)
+    return positional, keywords
+
 async def vin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Get auction data for a specific VIN with optional parameters."""
     if not context.args:
@@ -414,104 +1148,43 @@ async def vin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     subseries = None
     transmission = None
     query_params = {}
-    
-    # Check if we have keyword arguments (containing '=')
-    has_keyword_args = any('=' in arg for arg in context.args[1:])
-    
-    if has_keyword_args:
-        # Process as keyword arguments
-        for arg in context.args[1:]:
-            if '=' in arg:
-                key, value = arg.split('=', 1)
-                key = key.lower()  # Normalize keys to lowercase
-                
-                # Validate and convert parameter values
-                if key == 'color':
-                    value = value.upper()  # Normalize colors to uppercase
-                    
-                elif key == 'grade':
-                    try:
-                        float_value = float(value)
-                        if not 0 <= float_value <= 5:
-                            await update.message.reply_text(
-                                f"⚠️ *Warning*: Grade must be between 0 and 5. Using default value.",
-                                parse_mode="Markdown"
-                            )
-                            continue
-                        # Convert decimal grade (e.g., 3.5) to integer format (e.g., 35) for API
-                        value = int(float_value * 10)
-                    except ValueError:
-                        await update.message.reply_text(
-                            f"⚠️ *Warning*: Invalid grade '{value}'. Must be a number between 0 and 5. Using default value.",
-                            parse_mode="Markdown"
-                        )
-                        continue
-                        
-                elif key == 'date':
-                    # Validate date format (YYYY-MM-DD)
-                    try:
-                        # Parse date to validate format
-                        requested_date = datetime.strptime(value, "%Y-%m-%d")
-                        
-                        # Check if date is after minimum allowed date (2018-10-08)
-                        min_date = datetime.strptime("2018-10-08", "%Y-%m-%d")
-                        if requested_date < min_date:
-                            await update.message.reply_text(
-                                f"⚠️ *Warning*: Date must be on or after 2018-10-08. Using current date.",
-                                parse_mode="Markdown"
-                            )
-                            continue
-                            
-                        # Check if date is in the future
-                        if requested_date > datetime.now():
-                            await update.message.reply_text(
-                                f"⚠️ *Warning*: Date cannot be in the future. Using current date.",
-                                parse_mode="Markdown"
-                            )
-                            continue
-                            
-                    except ValueError:
-                        await update.message.reply_text(
-                            f"⚠️ *Warning*: Invalid date format '{value}'. Must be in YYYY-MM-DD format. Using current date.",
-                            parse_mode="Markdown"
-                        )
-                        continue
-                        
-                elif key == 'odometer':
-                    try:
-                        value = int(value)
-                        if value < 0 or value > 999999:
-                            await update.message.reply_text(
-                                f"⚠️ *Warning*: Invalid mileage value. Using default value.",
-                                parse_mode="Markdown"
-                            )
-                            continue
-                    except ValueError:
-                        await update.message.reply_text(
-                            f"⚠️ *Warning*: Invalid mileage '{value}'. Must be a number. Using default value.",
-                            parse_mode="Markdown"
-                        )
-                        continue
-                        
-                elif key == 'region':
-                    value = value.upper()
-                    valid_regions = {"NE", "SE", "MW", "SW", "W"}
-                    if value not in valid_regions:
-                        await update.message.reply_text(
-                            f"⚠️ *Warning*: Invalid region '{value}'. Must be one of: NE, SE, MW, SW, W. Using default value.",
-                            parse_mode="Markdown"
-                        )
-                        continue
-                
-                # Add validated parameter to query
-                query_params[key] = value
+
+    # Fast path for the dominant bare "/vin VIN" shape: when the valuation
+    # is already cached there is no upstream wait to mask, so skip the
+    # "Searching..." status message and its Telegram round-trip entirely
+    skip_status_message = False
+    if len(context.args) == 1:
+        bare_key = ValuationCache.make_key(
+            "vin", vin, None, None, json.dumps({}, sort_keys=True)
+        )
+        skip_status_message = await valuation_cache.get(bare_key) is not None
+
+    # Split the remaining arguments into keyword and positional form in one pass
+    positional_args, keyword_args = parse_kv_args(context.args[1:])
+
+    if keyword_args:
+        # Process as keyword arguments, dispatching validation by key.
+        # Unknown keys pass through unchanged, as before
+        for key, value in keyword_args.items():
+            parser = VIN_ARG_PARSERS.get(key)
+            if parser:
+                value, warning = parser(value)
+                if warning:
+                    await update.message.reply_text(
+                        f"⚠️ *Warning*: {warning}",
+                        parse_mode="Markdown"
+                    )
+                    continue
+
+            # Add validated parameter to query
+            query_params[key] = value
     else:
         # Process as positional arguments (subseries, transmission)
-        if len(context.args) >= 2:
-            subseries = context.args[1]
-        
-        if len(context.args) >= 3:
-            transmission = context.args[2]
+        if positional_args:
+            subseries = positional_args[0]
+
+        if len(positional_args) >= 2:
+            transmission = positional_args[1]
     
     # Inform user of the search with a cleaner message
     params_list = []
@@ -522,84 +1195,90 @@ async def vin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     for key, value in query_params.items():
         params_list.append(f"{key.capitalize()}: {value}")
     
-    params_text = ", ".join(params_list)
-    if params_text:
-        search_message = f"🔍 *Searching for VIN:* `{vin}`\n*Parameters:* {params_text}"
-    else:
-        search_message = f"🔍 *Searching for VIN:* `{vin}`"
-    
-    await update.message.reply_text(search_message + "...", parse_mode="Markdown")
+    if not skip_status_message:
+        params_text = ", ".join(params_list)
+        if params_text:
+            search_message = f"🔍 *Searching for VIN:* `{vin}`\n*Parameters:* {params_text}"
+        else:
+            search_message = f"🔍 *Searching for VIN:* `{vin}`"
+
+        await update.message.reply_text(search_message + "...", parse_mode="Markdown")
     
     try:
         # Get vehicle data from Manheim API
-        data = get_vin_valuation(vin, subseries, transmission, **query_params)
-        
+        data = await get_vin_valuation(vin, subseries, transmission, validate=False, **query_params)
+
         if not data:
             await update.message.reply_text(f"❌ *No auction data found for VIN:* `{vin}`", parse_mode="Markdown")
             return
             
-        # Format and send the response with potential pagination
+        # Format and send the response with potential pagination. Large
+        # payloads can take a while to render to Markdown, so run the
+        # formatter on a worker thread instead of blocking the event loop
         MAX_MESSAGE_LENGTH = 4000  # Slightly less than Telegram's limit to accommodate markdown
-        formatted_data = format_auction_data(data)
+        formatted_data = await asyncio.to_thread(format_auction_data, data)
         
         # Check if we need pagination based on message length
         if len(formatted_data["message"]) > MAX_MESSAGE_LENGTH:
+            # Build all pages in one formatter traversal, off the loop
+            page_datas = await asyncio.to_thread(format_auction_data_pages, data, MAX_MESSAGE_LENGTH)
+            total_pages = page_datas[0]['total_pages']
+
             # First message with pagination details
             await update.message.reply_text(
-                f"📊 *Auction data for VIN:* `{vin}` (1/{formatted_data['total_pages']})",
+                f"📊 *Auction data for VIN:* `{vin}` (1/{total_pages})",
                 parse_mode="Markdown"
             )
-            
-            # Send paged messages
-            for page in range(1, formatted_data['total_pages'] + 1):
-                page_data = format_auction_data(data, MAX_MESSAGE_LENGTH, page)
-                
+
+            async def send_page(page, page_data):
                 # Create pagination controls if needed
                 if page_data['total_pages'] > 1:
                     # Add pagination controls as inline keyboard
-                    keyboard = []
                     pagination_row = []
-                    
+
                     if page > 1:
                         pagination_row.append(InlineKeyboardButton("« Prev", callback_data=f"page:{vin}:{page-1}"))
-                    
+
                     pagination_row.append(InlineKeyboardButton(f"{page}/{page_data['total_pages']}", callback_data="noop"))
-                    
+
                     if page < page_data['total_pages']:
                         pagination_row.append(InlineKeyboardButton("Next »", callback_data=f"page:{vin}:{page+1}"))
-                    
-                    keyboard.append(pagination_row)
-                    reply_markup = InlineKeyboardMarkup(keyboard)
-                    
-                    await update.message.reply_text(
+
+                    await send_with_rate_limit(
+                        update.message.reply_text,
                         page_data['message'],
                         parse_mode="Markdown",
-                        reply_markup=reply_markup
+                        reply_markup=InlineKeyboardMarkup([pagination_row])
                     )
                 else:
-                    await update.message.reply_text(
+                    await send_with_rate_limit(
+                        update.message.reply_text,
                         page_data['message'],
                         parse_mode="Markdown"
                     )
+
+            # Send the pages concurrently instead of awaiting each round-trip
+            # in sequence; the token bucket still caps the send rate
+            await asyncio.gather(*(
+                send_page(page, page_data)
+                for page, page_data in enumerate(page_datas, 1)
+            ))
         else:
             # No pagination needed, send as one message
             await update.message.reply_text(formatted_data["message"], parse_mode="Markdown")
         
         # Store data for potential refinement and transaction viewing
         user_id = update.effective_user.id
-        user_data_dict[user_id] = {
+        await sessions.set(user_id, {
             'vin': vin,
             'subseries': subseries,
             'transmission': transmission,
             'params': query_params,
-            'data': data  # Store full data response
-        }
+            'data': trim_valuation(data)  # Store only the fields we render
+        })
         
-        # Add to history cache
-        if user_id not in history_cache:
-            history_cache[user_id] = []
-            
-        # Add the new lookup to the start of the list (most recent first)
+        # Add the new lookup to the start of the history (most recent
+        # first); the deque's maxlen drops the oldest entry automatically
         history_entry = {
             'type': 'vin',
             'query': {
@@ -608,7 +1287,7 @@ async def vin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 'transmission': transmission,
                 'params': query_params.copy()
             },
-            'data': data,
+            'data': trim_valuation(data),
             'timestamp': datetime.now()
         }
         
@@ -616,24 +1295,16 @@ async def vin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         if 'date' in query_params:
             history_entry['historical'] = True
             
-        history_cache[user_id].insert(0, history_entry)
-        
-        # Keep only the 10 most recent lookups
-        if len(history_cache[user_id]) > 10:
-            history_cache[user_id].pop()
+        _record_history(user_id, history_entry)
         
         # Create keyboard with appropriate options
         keyboard = []
         
-        # Add "View All Transactions" button if there are transactions
-        has_transactions = (
-            "marketSummary" in data and 
-            "transactions" in data["marketSummary"] and 
-            data["marketSummary"]["transactions"]
-        )
-        transaction_count = len(data["marketSummary"]["transactions"]) if has_transactions else 0
+        # One traversal answers both "are there transactions" and "is there
+        # historical data" for the keyboard decisions below
+        transaction_count, has_historical_data = summarize_valuation(data)
         
-        if has_transactions and transaction_count > 3:
+        if transaction_count > 3:
             keyboard.append([InlineKeyboardButton(
                 f"📋 View All {transaction_count} Transactions", 
                 callback_data="view_all_transactions"
@@ -642,7 +1313,7 @@ async def vin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             # Add quick filters if there are enough transactions
             if transaction_count >= 10:
                 # Add "Recent Transactions" button - last 6 months
-                six_months_ago = (datetime.now() - timedelta(days=180)).strftime("%Y-%m-%d")
+                six_months_ago, _ = _date_thresholds()
                 keyboard.append([InlineKeyboardButton(
                     "🕒 Last 6 Months Only", 
                     callback_data=f"view_all_transactions:date:{six_months_ago}"
@@ -655,15 +1326,7 @@ async def vin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 )])
         
         # Add price trend chart option if there are historical transactions or historical data
-        has_historical_data = (
-            "historicalAverages" in data and 
-            (("last30days" in data["historicalAverages"] and "price" in data["historicalAverages"]["last30days"]) or
-             ("lastMonth" in data["historicalAverages"] and "price" in data["historicalAverages"]["lastMonth"]) or
-             ("lastSixMonths" in data["historicalAverages"] and "price" in data["historicalAverages"]["lastSixMonths"]) or
-             ("lastYear" in data["historicalAverages"] and "price" in data["historicalAverages"]["lastYear"]))
-        )
-        
-        if has_historical_data or (has_transactions and transaction_count >= 3):
+        if has_historical_data or transaction_count >= 3:
             keyboard.append([InlineKeyboardButton(
                 "📈 Generate Price Trend Chart", 
                 callback_data=f"generate_chart:{vin}"
@@ -671,7 +1334,7 @@ async def vin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         
         # Add refinement option if no color or grade were provided
         if 'color' not in query_params or 'grade' not in query_params:
-            keyboard.append([InlineKeyboardButton("🔄 Refine Valuation", callback_data="refine_valuation")])
+            keyboard.append([REFINE_BUTTON])
         
         # Only show keyboard if there are buttons to display
         if keyboard:
@@ -683,7 +1346,7 @@ async def vin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
             )
             
     except Exception as e:
-        logger.error(f"Error fetching VIN data: {e}")
+        logger.error("Error fetching VIN data: %s", e)
         await update.message.reply_text(
             f"⚠️ *Error fetching data for VIN:* `{vin}`\nPlease try again later.",
             parse_mode="Markdown"
@@ -695,19 +1358,13 @@ async def refine_valuation_callback(update: Update, context: ContextTypes.DEFAUL
     await query.answer()
     
     user_id = update.effective_user.id
-    if user_id not in user_data_dict:
+    session = await sessions.get(user_id)
+    if not session:
         await query.edit_message_text("Sorry, your session has expired. Please start a new search with /vin.")
         return ConversationHandler.END
-    
+
     # Start with color selection
-    colors = ["BLACK", "WHITE", "SILVER", "GRAY", "RED", "BLUE", "BROWN", "GREEN", "GOLD", "OTHER"]
-    keyboard = []
-    for color in colors:
-        keyboard.append([InlineKeyboardButton(color, callback_data=f"color_{color}")])
-    keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="cancel")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    await query.edit_message_text("Please select the vehicle color:", reply_markup=reply_markup)
+    await query.edit_message_text("Please select the vehicle color:", reply_markup=COLOR_KEYBOARD)
     return CHOOSING_COLOR
 
 async def color_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -716,25 +1373,21 @@ async def color_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await query.answer()
     
     user_id = update.effective_user.id
-    if user_id not in user_data_dict:
-        await query.edit_message_text("Sorry, your session has expired. Please start a new search with /vin.")
-        return ConversationHandler.END
-    
-    # Get the color from callback data
-    color = query.data.split("_")[1]
-    user_data_dict[user_id]['params']['color'] = color
+    async with sessions.lock(user_id):
+        session = await sessions.get(user_id)
+        if not session:
+            await query.edit_message_text("Sorry, your session has expired. Please start a new search with /vin.")
+            return ConversationHandler.END
+
+        # Get the color from callback data
+        color = COLOR_BY_CALLBACK.get(query.data)
+        session['params']['color'] = color
+        await sessions.set(user_id, session)
     
     # Now ask for grade (Manheim uses 0-5 scale)
-    grades = ["1.0", "1.5", "2.0", "2.5", "3.0", "3.5", "4.0", "4.5", "5.0"]
-    keyboard = []
-    for grade in grades:
-        keyboard.append([InlineKeyboardButton(f"Grade {grade}", callback_data=f"grade_{grade}")])
-    keyboard.append([InlineKeyboardButton("❌ Cancel", callback_data="cancel")])
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
         f"Selected color: {color}\nPlease select the vehicle condition grade:",
-        reply_markup=reply_markup
+        reply_markup=GRADE_KEYBOARD
     )
     return CHOOSING_GRADE
 
@@ -744,37 +1397,24 @@ async def grade_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await query.answer()
     
     user_id = update.effective_user.id
-    if user_id not in user_data_dict:
-        await query.edit_message_text("Sorry, your session has expired. Please start a new search with /vin.")
-        return ConversationHandler.END
-    
-    # Get the grade from callback data
-    grade = query.data.split("_")[1]
-    user_data_dict[user_id]['params']['grade'] = float(grade)
-    
+    async with sessions.lock(user_id):
+        session = await sessions.get(user_id)
+        if not session:
+            await query.edit_message_text("Sorry, your session has expired. Please start a new search with /vin.")
+            return ConversationHandler.END
+
+        # Get the grade from callback data
+        grade = GRADE_BY_CALLBACK.get(query.data)
+        params = session['params']
+        params['grade'] = grade
+        await sessions.set(user_id, session)
+
     # Ask for odometer (mileage)
-    keyboard = [
-        [
-            InlineKeyboardButton("< 10,000", callback_data="odometer_5000"),
-            InlineKeyboardButton("10-30k", callback_data="odometer_20000")
-        ],
-        [
-            InlineKeyboardButton("30-60k", callback_data="odometer_45000"),
-            InlineKeyboardButton("60-100k", callback_data="odometer_80000")
-        ],
-        [
-            InlineKeyboardButton("100-150k", callback_data="odometer_125000"),
-            InlineKeyboardButton("> 150k", callback_data="odometer_175000")
-        ],
-        [InlineKeyboardButton("❌ Cancel", callback_data="cancel")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
-        f"Selected color: {user_data_dict[user_id]['params']['color']}\n"
+        f"Selected color: {params['color']}\n"
         f"Selected grade: {grade}\n"
         f"Please select approximate mileage:",
-        reply_markup=reply_markup
+        reply_markup=ODOMETER_KEYBOARD
     )
     return CHOOSING_ODOMETER
 
@@ -784,38 +1424,25 @@ async def odometer_callback(update: Update, context: ContextTypes.DEFAULT_TYPE)
     await query.answer()
     
     user_id = update.effective_user.id
-    if user_id not in user_data_dict:
-        await query.edit_message_text("Sorry, your session has expired. Please start a new search with /vin.")
-        return ConversationHandler.END
-    
-    # Get the odometer from callback data
-    odometer = query.data.split("_")[1]
-    user_data_dict[user_id]['params']['odometer'] = int(odometer)
-    
+    async with sessions.lock(user_id):
+        session = await sessions.get(user_id)
+        if not session:
+            await query.edit_message_text("Sorry, your session has expired. Please start a new search with /vin.")
+            return ConversationHandler.END
+
+        # Get the odometer from callback data
+        odometer = ODOMETER_BY_CALLBACK.get(query.data)
+        params = session['params']
+        params['odometer'] = odometer
+        await sessions.set(user_id, session)
+
     # Ask for region
-    keyboard = [
-        [
-            InlineKeyboardButton("Northeast (NE)", callback_data="region_NE"),
-            InlineKeyboardButton("Southeast (SE)", callback_data="region_SE")
-        ],
-        [
-            InlineKeyboardButton("Midwest (MW)", callback_data="region_MW"),
-            InlineKeyboardButton("Southwest (SW)", callback_data="region_SW")
-        ],
-        [
-            InlineKeyboardButton("West (W)", callback_data="region_W"),
-            InlineKeyboardButton("Skip", callback_data="region_skip")
-        ],
-        [InlineKeyboardButton("❌ Cancel", callback_data="cancel")]
-    ]
-    
-    reply_markup = InlineKeyboardMarkup(keyboard)
     await query.edit_message_text(
-        f"Selected color: {user_data_dict[user_id]['params']['color']}\n"
-        f"Selected grade: {user_data_dict[user_id]['params']['grade']}\n"
+        f"Selected color: {params['color']}\n"
+        f"Selected grade: {params['grade']}\n"
         f"Selected mileage: {odometer}\n"
         f"Please select region:",
-        reply_markup=reply_markup
+        reply_markup=REGION_KEYBOARD
     )
     return CHOOSING_REGION
 
@@ -825,28 +1452,32 @@ async def region_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await query.answer()
     
     user_id = update.effective_user.id
-    if user_id not in user_data_dict:
-        await query.edit_message_text("Sorry, your session has expired. Please start a new search with /vin.")
-        return ConversationHandler.END
-    
-    # Get the region from callback data if not skipped
-    region_data = query.data.split("_")[1]
-    if region_data != "skip":
-        user_data_dict[user_id]['params']['region'] = region_data
-    
+    async with sessions.lock(user_id):
+        session = await sessions.get(user_id)
+        if not session:
+            await query.edit_message_text("Sorry, your session has expired. Please start a new search with /vin.")
+            return ConversationHandler.END
+
+        # Get the region from callback data; "region_skip" maps to None
+        region = REGION_BY_CALLBACK.get(query.data)
+        if region:
+            session['params']['region'] = region
+            await sessions.set(user_id, session)
+
     # Show that we're processing
     await query.edit_message_text("Fetching refined valuation with your parameters...")
-    
-    # Get the data for the API call
-    user_data = user_data_dict[user_id]
-    vin = user_data['vin']
-    subseries = user_data['subseries']
-    transmission = user_data['transmission']
-    params = user_data['params']
-    
+
+    # Get the data for the API call. Normalize a copy of the session params
+    # (the grade must reach the API on its 10-50 integer scale) so the
+    # session keeps the decimal values the prompts display
+    vin = session['vin']
+    subseries = session['subseries']
+    transmission = session['transmission']
+    params = _normalize_vin_params(dict(session['params']))
+
     try:
         # Get vehicle data from Manheim API with the refined parameters
-        data = get_vin_valuation(vin, subseries, transmission, **params)
+        data = await get_vin_valuation(vin, subseries, transmission, validate=False, **params)
         
         if not data:
             await context.bot.send_message(
@@ -862,12 +1493,8 @@ async def region_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 parse_mode="Markdown"
             )
             
-            # Add to history cache
-            if user_id not in history_cache:
-                history_cache[user_id] = []
-                
             # Add the refined lookup to the history
-            history_cache[user_id].insert(0, {
+            _record_history(user_id, {
                 'type': 'vin',
                 'query': {
                     'vin': vin,
@@ -875,26 +1502,21 @@ async def region_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                     'transmission': transmission,
                     'params': params.copy()
                 },
-                'data': data,
+                'data': trim_valuation(data),
                 'timestamp': datetime.now(),
                 'refined': True
             })
             
-            # Keep only the 10 most recent lookups
-            if len(history_cache[user_id]) > 10:
-                history_cache[user_id].pop()
-            
     except Exception as e:
-        logger.error(f"Error fetching refined VIN data: {e}")
+        logger.error("Error fetching refined VIN data: %s", e)
         await context.bot.send_message(
             chat_id=update.effective_chat.id,
             text=f"Error fetching refined data for VIN: {vin}. Please try again later."
         )
     
     # Clear user data to free memory
-    if user_id in user_data_dict:
-        del user_data_dict[user_id]
-    
+    await sessions.delete(user_id)
+
     return ConversationHandler.END
 
 async def view_all_transactions_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -903,153 +1525,99 @@ async def view_all_transactions_callback(update: Update, context: ContextTypes.D
     await query.answer()
     
     user_id = update.effective_user.id
-    if user_id not in user_data_dict or 'data' not in user_data_dict[user_id]:
+    session = await sessions.get(user_id)
+    if not session or 'data' not in session:
         await query.edit_message_text(
             "⚠️ *Transaction data is no longer available.*\nPlease perform a new search with /vin.",
             parse_mode="Markdown"
         )
         return
-    
+
     # Get the full data from user storage
-    data = user_data_dict[user_id]['data']
-    vin = user_data_dict[user_id]['vin']
-    
-    # Check if transactions exist
-    has_transactions = (
-        "marketSummary" in data and 
-        "transactions" in data["marketSummary"] and 
-        data["marketSummary"]["transactions"]
-    )
+    data = session['data']
+    vin = session['vin']
+    
+    # Check if transactions exist with a single .get chain
+    transactions = (data.get("marketSummary") or {}).get("transactions")
     
-    if not has_transactions:
+    if not transactions:
         await query.edit_message_text(
             "❌ *No transaction data available for this VIN.*",
             parse_mode="Markdown"
         )
         return
     
-    transactions = data["marketSummary"]["transactions"]
-    
     # Check for transaction filters in callback data (format: "view_all_transactions:filter_type:value")
     filter_parts = query.data.split(':')
     filter_type = filter_parts[1] if len(filter_parts) > 1 else None
     filter_value = filter_parts[2] if len(filter_parts) > 2 else None
     
-    # Apply filters if provided
-    filtered_transactions = transactions
+    # Resolve the filter to a predicate; matches are counted and sliced
+    # lazily below so only the current page is ever materialized
     filter_description = ""
-    
+    predicate = None
+
     if filter_type and filter_value:
-        if filter_type == "grade":
-            # Convert grade filter to match API format
-            min_grade = float(filter_value)
-            filter_description = f"(Grade ≥ {filter_value})"
-            filtered_transactions = [
-                tx for tx in transactions 
-                if "conditionGrade" in tx and 
-                (float(tx["conditionGrade"]) / 10 if float(tx["conditionGrade"]) > 5 else float(tx["conditionGrade"])) >= min_grade
-            ]
-        elif filter_type == "odometer":
-            # Odometer filter (less than the specified value)
-            max_miles = int(filter_value)
-            filter_description = f"(Mileage ≤ {max_miles:,})"
-            filtered_transactions = [
-                tx for tx in transactions 
-                if "odometer" in tx and int(tx["odometer"]) <= max_miles
-            ]
-        elif filter_type == "date":
-            # Date filter (newer or equal to the specified date)
-            date_threshold = filter_value
-            filter_description = f"(Date ≥ {date_threshold})"
-            filtered_transactions = [
-                tx for tx in transactions 
-                if "saleDate" in tx and tx["saleDate"].split('T')[0] >= date_threshold
-            ]
-        elif filter_type == "region":
-            # Region filter (exact match)
-            region = filter_value
-            filter_description = f"(Region: {region})"
-            filtered_transactions = [
-                tx for tx in transactions 
-                if "region" in tx and tx["region"] == region
-            ]
-    
+        filter_fn = TRANSACTION_FILTERS.get(filter_type)
+        if filter_fn:
+            filter_description, predicate = filter_fn(filter_value)
+
+    if predicate is None:
+        match_count = len(transactions)
+    else:
+        match_count = sum(1 for tx in transactions if predicate(tx))
+
     # Create a detailed message with all transactions
     if filter_description:
-        message = f"📋 *Filtered Transactions for VIN:* `{vin}` {filter_description}\n\n"
+        parts = [f"📋 *Filtered Transactions for VIN:* `{vin}` {filter_description}\n\n"]
     else:
-        message = f"📋 *All Transactions for VIN:* `{vin}`\n\n"
-    
+        parts = [f"📋 *All Transactions for VIN:* `{vin}`\n\n"]
+
     # Show count of displayed transactions vs total
-    message += f"*Showing {len(filtered_transactions)} of {len(transactions)} transactions*\n\n"
-    
+    parts.append(f"*Showing {match_count} of {len(transactions)} transactions*\n\n")
+
     # Display pagination info if needed
     page = 1
     transactions_per_page = 10
-    max_pages = (len(filtered_transactions) + transactions_per_page - 1) // transactions_per_page
+    max_pages = (match_count + transactions_per_page - 1) // transactions_per_page
     
     # Extract page number if in callback data (format additional part: :page:3)
     if len(filter_parts) > 3 and filter_parts[3] == "page" and len(filter_parts) > 4:
         try:
-            page = int(filter_parts[4])
-            if page < 1:
-                page = 1
-            elif page > max_pages:
-                page = max_pages
+            # Clamp to [1, max_pages]; a stale button can name a page that
+            # no longer exists, and with zero matches max_pages is 0, which
+            # must not drive start_idx negative
+            page = max(1, min(int(filter_parts[4]), max_pages))
         except ValueError:
             page = 1
     
     # Calculate slice for pagination
     start_idx = (page - 1) * transactions_per_page
-    end_idx = min(start_idx + transactions_per_page, len(filtered_transactions))
-    
+    end_idx = min(start_idx + transactions_per_page, match_count)
+
+    # Materialize only the current page of matches
+    if predicate is None:
+        page_transactions = transactions[start_idx:end_idx]
+    else:
+        page_transactions = list(islice(filter(predicate, transactions), start_idx, end_idx))
+
     # Add pagination info if needed
-    if len(filtered_transactions) > transactions_per_page:
-        message += f"*Page {page} of {max_pages}*\n\n"
-    
+    if match_count > transactions_per_page:
+        parts.append(f"*Page {page} of {max_pages}*\n\n")
+
     # Add filter options if we're on the first page and not already filtering
     if page == 1 and not filter_type:
-        message += "*Filter options:* Use buttons below to filter transactions\n\n"
-    
+        parts.append("*Filter options:* Use buttons below to filter transactions\n\n")
+
     # Display transactions for current page
-    for i, tx in enumerate(filtered_transactions[start_idx:end_idx], start_idx + 1):
-        message += f"*Transaction #{i}*\n"
-        
-        if "price" in tx:
-            message += f"• *Price:* ${tx.get('price', 0):,.2f}\n"
-        
-        if "saleDate" in tx:
-            sale_date = tx.get('saleDate', '').split('T')[0]  # Format ISO date
-            message += f"• *Date:* {sale_date}\n"
-        
-        if "odometer" in tx:
-            message += f"• *Mileage:* {tx.get('odometer', 0):,} miles\n"
-        
-        if "conditionGrade" in tx:
-            grade_value = tx.get('conditionGrade', 'N/A')
-            if isinstance(grade_value, (int, float)) and grade_value > 5:
-                grade_value = grade_value / 10.0
-            message += f"• *Condition:* {grade_value}/5.0\n"
-        
-        if "location" in tx:
-            message += f"• *Location:* {tx.get('location', 'N/A')}\n"
-        
-        if "lane" in tx:
-            message += f"• *Lane:* {tx.get('lane', 'N/A')}\n"
-        
-        if "sellerName" in tx:
-            message += f"• *Seller:* {tx.get('sellerName', 'N/A')}\n"
-        
-        # Add only important additional transaction details
-        important_fields = ["color", "trim", "model", "bodyStyle", "cylinder", "fuel"]
-        for key in important_fields:
-            if key in tx and tx[key]:
-                # Format the key with spaces before uppercase letters
-                formatted_key = ''.join(' ' + c if c.isupper() else c for c in key).strip().capitalize()
-                message += f"• *{formatted_key}:* {tx[key]}\n"
-        
-        message += "\n"
-    
+    parts.extend(
+        _format_transaction_detail(i, tx)
+        for i, tx in enumerate(page_transactions, start_idx + 1)
+    )
+
+    # Assemble the full message in one pass
+    message = "".join(parts)
+
     # Create keyboard with filter options and pagination controls
     keyboard = []
     
@@ -1068,15 +1636,14 @@ async def view_all_transactions_callback(update: Update, context: ContextTypes.D
         ])
         
         # Date filters - last 6 months and last 1 year
-        six_months_ago = (datetime.now() - timedelta(days=180)).strftime("%Y-%m-%d")
-        one_year_ago = (datetime.now() - timedelta(days=365)).strftime("%Y-%m-%d")
+        six_months_ago, one_year_ago = _date_thresholds()
         keyboard.append([
             InlineKeyboardButton("Last 6 Months", callback_data=f"view_all_transactions:date:{six_months_ago}"),
             InlineKeyboardButton("Last Year", callback_data=f"view_all_transactions:date:{one_year_ago}")
         ])
     
     # Add pagination controls if needed
-    if len(filtered_transactions) > transactions_per_page:
+    if match_count > transactions_per_page:
         pagination_buttons = []
         
         # Previous page button (if not on first page)
@@ -1096,10 +1663,10 @@ async def view_all_transactions_callback(update: Update, context: ContextTypes.D
     
     # Add reset filters button if currently filtering
     if filter_type:
-        keyboard.append([InlineKeyboardButton("❌ Clear Filters", callback_data="view_all_transactions")])
+        keyboard.append([CLEAR_FILTERS_BUTTON])
     
     # Add a cancel button at the bottom
-    keyboard.append([InlineKeyboardButton("Close", callback_data="cancel")])
+    keyboard.append([CLOSE_BUTTON])
     
     # Set up reply markup
     reply_markup = InlineKeyboardMarkup(keyboard)
@@ -1113,24 +1680,20 @@ async def view_all_transactions_callback(update: Update, context: ContextTypes.D
         # Send initial message
         await query.edit_message_text("Sending transaction details...")
         
-        # Split into multiple messages
-        for i in range(0, len(message), MAX_MESSAGE_LENGTH):
-            chunk = message[i:i + MAX_MESSAGE_LENGTH]
-            
-            # Only add keyboard to the last chunk
-            if i + MAX_MESSAGE_LENGTH >= len(message):
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id, 
-                    text=chunk,
-                    parse_mode="Markdown",
-                    reply_markup=reply_markup
-                )
-            else:
-                await context.bot.send_message(
-                    chat_id=update.effective_chat.id, 
-                    text=chunk,
-                    parse_mode="Markdown"
-                )
+        # Split into multiple messages. These are raw continuation slices of
+        # one text with no per-chunk labels, so they must arrive in order:
+        # await each send before dispatching the next (concurrent sends can
+        # be delivered out of order). The token bucket still paces the burst
+        # and only the last chunk carries the keyboard.
+        chunks = [message[i:i + MAX_MESSAGE_LENGTH] for i in range(0, len(message), MAX_MESSAGE_LENGTH)]
+        for index, chunk in enumerate(chunks):
+            await send_with_rate_limit(
+                context.bot.send_message,
+                chat_id=update.effective_chat.id,
+                text=chunk,
+                parse_mode="Markdown",
+                reply_markup=reply_markup if index == len(chunks) - 1 else None
+            )
 
 async def cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """Cancel the refinement process."""
@@ -1138,15 +1701,49 @@ async def cancel_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     await query.answer()
     
     user_id = update.effective_user.id
-    if user_id in user_data_dict:
-        del user_data_dict[user_id]
-    
+    await sessions.delete(user_id)
+
     await query.edit_message_text(
         "❌ *Refinement canceled*\nYou can start a new search with /vin.",
         parse_mode="Markdown"
     )
     return ConversationHandler.END
     
+def _payload_digest(data):
+    """Short stable digest of a payload dict for render-cache keys.
+
+    A VIN alone is not enough to key a rendered artifact: a refined lookup
+    replaces the payload behind the same VIN, so the key must change with
+    the data itself.
+    """
+    raw = json_dumps(data)
+    if isinstance(raw, str):
+        raw = raw.encode()
+    return hashlib.blake2b(raw, digest_size=8).digest()
+
+# Rendered-page cache for pagination clicks. Clicking through pages re-runs
+# the full formatter over an unchanged payload, so keep the rendered page
+# dicts for a few minutes, keyed per user in case refinements diverge.
+PAGE_CACHE_TTL_SECONDS = 600
+_page_cache = {}
+
+def _page_cache_get(key):
+    """Return a cached rendered page, or None on miss/expiry."""
+    entry = _page_cache.get(key)
+    if not entry:
+        return None
+    page_data, expires_at = entry
+    if time.monotonic() >= expires_at:
+        del _page_cache[key]
+        return None
+    return page_data
+
+def _page_cache_set(key, page_data):
+    """Cache a rendered page, resetting the table if it grows too large."""
+    if len(_page_cache) >= 2048:
+        _page_cache.clear()
+    _page_cache[key] = (page_data, time.monotonic() + PAGE_CACHE_TTL_SECONDS)
+
 async def page_navigation_callback(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Handle pagination navigation for large result sets."""
     query = update.callback_query
@@ -1171,17 +1768,20 @@ async def page_navigation_callback(update: Update, context: ContextTypes.DEFAULT
         user_id = update.effective_user.id
         vehicle_data = None
         
-        if user_id in history_cache:
+        user_history = _user_history(user_id)
+        if user_history:
             # Look for matching VIN in history
-            for entry in history_cache[user_id]:
+            for entry in user_history:
                 if entry['type'] == 'vin' and entry['query']['vin'] == vin:
                     vehicle_data = entry['data']
                     break
         
         # If not found in history but user has active data
-        if not vehicle_data and user_id in user_data_dict and user_data_dict[user_id].get('vin') == vin:
-            vehicle_data = user_data_dict[user_id].get('data')
-        
+        if not vehicle_data:
+            session = await sessions.get(user_id)
+            if session and session.get('vin') == vin:
+                vehicle_data = session.get('data')
+
         if not vehicle_data:
             await query.edit_message_text(
                 "❌ *Data no longer available*\nPlease perform a new search.",
@@ -1189,9 +1789,15 @@ async def page_navigation_callback(update: Update, context: ContextTypes.DEFAULT
             )
             return
             
-        # Format the data for the requested page
+        # Format the data for the requested page, reusing a recent render
+        # of the same page when available; the digest keeps a refined
+        # payload from serving pages rendered before the refinement
         MAX_MESSAGE_LENGTH = 4000
-        page_data = format_auction_data(vehicle_data, MAX_MESSAGE_LENGTH, page_number)
+        page_key = (user_id, vin, page_number, _payload_digest(vehicle_data))
+        page_data = _page_cache_get(page_key)
+        if page_data is None:
+            page_data = format_auction_data(vehicle_data, MAX_MESSAGE_LENGTH, page_number)
+            _page_cache_set(page_key, page_data)
         
         # Create pagination controls
         keyboard = []
@@ -1242,15 +1848,13 @@ async def generate_chart_callback(update: Update, context: ContextTypes.DEFAULT_
     query = update.callback_query
     await query.answer()
     
-    # Extract VIN or YMM data from callback
-    parts = query.data.split(':')
-    if len(parts) < 2:
+    # Extract VIN or YMM data from callback; partition avoids building a list
+    # for the fixed two-part "generate_chart:<identifier>" format
+    chart_type, sep, identifier = query.data.partition(':')
+    if not sep or not identifier:
         await query.edit_message_text("❌ Invalid chart request format", parse_mode="Markdown")
         return
     
-    chart_type = parts[0]  # "generate_chart"
-    identifier = parts[1]  # VIN or other identifier
-    
     # Status message while generating chart
     await query.edit_message_text("📊 *Generating price trend chart...*", parse_mode="Markdown")
     
@@ -1259,9 +1863,10 @@ async def generate_chart_callback(update: Update, context: ContextTypes.DEFAULT_
     vehicle_info = ""
     
     # Find the vehicle data from user history or active context
-    if user_id in history_cache:
+    user_history = _user_history(user_id)
+    if user_history:
         # Look for matching VIN in history
-        for entry in history_cache[user_id]:
+        for entry in user_history:
             if entry['type'] == 'vin' and entry['query']['vin'] == identifier:
                 vehicle_data = entry['data']
                 # Get basic vehicle info
@@ -1272,14 +1877,16 @@ async def generate_chart_callback(update: Update, context: ContextTypes.DEFAULT_
                 break
     
     # If not found in history but user has active data
-    if not vehicle_data and user_id in user_data_dict and user_data_dict[user_id].get('vin') == identifier:
-        vehicle_data = user_data_dict[user_id].get('data')
-        # Get basic vehicle info
-        if 'vehicle' in vehicle_data:
-            v = vehicle_data['vehicle']
-            if all(k in v for k in ['year', 'make', 'model']):
-                vehicle_info = f"{v.get('year')} {v.get('make')} {v.get('model')}"
-    
+    if not vehicle_data:
+        session = await sessions.get(user_id)
+        if session and session.get('vin') == identifier:
+            vehicle_data = session.get('data')
+            # Get basic vehicle info
+            if vehicle_data and 'vehicle' in vehicle_data:
+                v = vehicle_data['vehicle']
+                if all(k in v for k in ['year', 'make', 'model']):
+                    vehicle_info = f"{v.get('year')} {v.get('make')} {v.get('model')}"
+
     if not vehicle_data:
         await query.edit_message_text(
             "❌ *Data no longer available*\nPlease perform a new search to generate a chart.",
@@ -1287,20 +1894,29 @@ async def generate_chart_callback(update: Update, context: ContextTypes.DEFAULT_
         )
         return
     
-    # Generate chart image
-    chart_image = generate_price_trend_chart(vehicle_data, vehicle_info)
-    
-    if not chart_image:
-        await query.edit_message_text(
-            "❌ *Unable to generate chart*\nNot enough price data available.",
-            parse_mode="Markdown"
-        )
-        return
-    
+    # Generate chart image, reusing a recent render of the same chart; the
+    # payload digest keys the cache to the actual data, so a refinement (or
+    # another user's differently-parameterized lookup of the same VIN) never
+    # gets a chart rendered from an older payload
+    # Matplotlib rendering is CPU-bound and takes hundreds of ms; run it on
+    # a worker thread so the event loop keeps serving other updates
+    chart_key = (identifier, vehicle_info, _payload_digest(vehicle_data))
+    chart_bytes = _chart_cache_get(chart_key)
+    if chart_bytes is None:
+        chart_image = await asyncio.to_thread(generate_price_trend_chart, vehicle_data, vehicle_info)
+        if not chart_image:
+            await query.edit_message_text(
+                "❌ *Unable to generate chart*\nNot enough price data available.",
+                parse_mode="Markdown"
+            )
+            return
+        chart_bytes = chart_image.getvalue()
+        _chart_cache_set(chart_key, chart_bytes)
+
     # Send the chart image
     await context.bot.send_photo(
         chat_id=update.effective_chat.id,
-        photo=chart_image,
+        photo=io.BytesIO(chart_bytes),
         caption=f"📈 *Price Trend Chart*\n{vehicle_info} (VIN: {identifier})",
         parse_mode="Markdown"
     )
@@ -1309,6 +1925,46 @@ async def generate_chart_callback(update: Update, context: ContextTypes.DEFAULT_
     original_message = "📊 *Price trend chart generated!*"
     await query.edit_message_text(original_message, parse_mode="Markdown")
     
+# Rendered chart PNGs keyed by (identifier, vehicle_info). A repeat chart
+# click re-rasterizes the exact same figure, so keep the bytes around for a
+# short TTL (the backing valuation data is itself cached) and skip the
+# matplotlib work entirely on a hit.
+CHART_CACHE_TTL_SECONDS = 600
+_chart_cache = {}
+
+def _chart_cache_get(key):
+    """Return cached chart PNG bytes for key, or None if absent/expired."""
+    cached = _chart_cache.get(key)
+    if cached is None:
+        return None
+    png_bytes, expires_at = cached
+    if time.monotonic() >= expires_at:
+        del _chart_cache[key]
+        return None
+    return png_bytes
+
+def _chart_cache_set(key, png_bytes):
+    """Store chart PNG bytes for key, clearing the cache if it grows large."""
+    if len(_chart_cache) >= 256:
+        _chart_cache.clear()
+    _chart_cache[key] = (png_bytes, time.monotonic() + CHART_CACHE_TTL_SECONDS)
+
+# matplotlib (and its transitive numpy import) is by far the heaviest module
+# the bot touches but is only needed for chart generation, so it is imported
+# lazily on first use instead of slowing down every start-up
+_plt = None
+
+def get_pyplot():
+    """Import matplotlib on first use, configured for headless rendering."""
+    global _plt
+    if _plt is None:
+        import matplotlib
+        matplotlib.use('Agg')  # Use non-interactive backend
+        import matplotlib.pyplot as plt
+        plt.style.use('ggplot')  # Apply the rc settings once, not per chart
+        _plt = plt
+    return _plt
+
 def generate_price_trend_chart(data, vehicle_info="Vehicle"):
     """
     Generate a price trend chart image from vehicle data.
@@ -1361,9 +2017,13 @@ def generate_price_trend_chart(data, vehicle_info="Vehicle"):
             if "saleDate" in tx and "price" in tx
         ]
         
-        # Sort transactions by date (oldest to newest)
-        valid_transactions.sort(key=lambda tx: tx["saleDate"])
-        
+        # Sort transactions by date (oldest to newest); the API usually
+        # returns them in order already, so check first and skip the
+        # per-element key calls when no sort is needed
+        sale_dates = [tx["saleDate"] for tx in valid_transactions]
+        if any(a > b for a, b in zip(sale_dates, sale_dates[1:])):
+            valid_transactions.sort(key=lambda tx: tx["saleDate"])
+
         # Only add up to 10 additional transaction points to keep chart readable
         max_tx_points = 10
         if len(valid_transactions) > max_tx_points:
@@ -1373,10 +2033,12 @@ def generate_price_trend_chart(data, vehicle_info="Vehicle"):
         
         # Add transaction points to the chart
         for tx in valid_transactions:
-            # Format the date to short form
-            date_str = tx["saleDate"].split("T")[0]
+            # Format the date to short form; the date is the first ten
+            # characters of the ISO timestamp, and fromisoformat parses it
+            # far faster than strptime's format-string machinery
+            date_str = tx["saleDate"][:10]
             try:
-                date_obj = datetime.strptime(date_str, "%Y-%m-%d")
+                date_obj = datetime.fromisoformat(date_str)
                 date_label = date_obj.strftime("%m/%d/%y")
             except ValueError:
                 date_label = date_str
@@ -1396,23 +2058,20 @@ def generate_price_trend_chart(data, vehicle_info="Vehicle"):
         return None
     
     # Create the chart
+    plt = get_pyplot()
     plt.figure(figsize=(10, 6))
-    
-    # Set style
-    plt.style.use('ggplot')
-    
+
     # Plot price trend line
     ax1 = plt.gca()
     line1, = ax1.plot(time_points, prices, marker='o', linewidth=2, color='#3366cc', markersize=8)
     
-    # Add price labels above each point
-    for i, price in enumerate(prices):
-        ax1.annotate(price_labels[i], 
-                    (time_points[i], prices[i]), 
-                    textcoords="offset points", 
-                    xytext=(0, 10), 
-                    ha='center',
-                    fontweight='bold')
+    # Add price labels above each point with plain Text artists; ax1.text
+    # skips the Annotation machinery annotate builds per point
+    label_offset = plt.matplotlib.transforms.offset_copy(
+        ax1.transData, fig=plt.gcf(), y=10, units='dots'
+    )
+    for xi, yi, label in zip(time_points, prices, price_labels):
+        ax1.text(xi, yi, label, transform=label_offset, ha='center', fontweight='bold')
     
     # Set up y-axis for prices
     ax1.set_ylabel('Price (USD)', fontsize=12, fontweight='bold')
@@ -1496,6 +2155,31 @@ def generate_price_trend_chart(data, vehicle_info="Vehicle"):
     
     return buf
 
+# Characters that never need percent-encoding in a URL path segment.
+# Typical year/make/model values are plain ASCII, so a single C-level regex
+# match replaces quote()'s per-character table lookup on the common path.
+_URL_SAFE_RE = re.compile(r"[A-Za-z0-9._~-]*\Z")
+
+def _quote_path_segment(value):
+    """Percent-encode a URL path segment, skipping quote() for safe inputs."""
+    value = str(value)
+    if _URL_SAFE_RE.match(value):
+        return value
+    return quote(value)
+
+# Year bounds for YMM validation. The first cars were made in the late
+# 1800s; the upper bound tracks the calendar and is re-read at most once a
+# day instead of calling datetime.now() on every validation.
+MIN_VEHICLE_YEAR = 1885
+_max_year_cache = {"value": date.today().year + 1, "checked": time.monotonic()}
+
+def _max_vehicle_year():
+    """Return the newest acceptable model year (next calendar year)."""
+    if time.monotonic() - _max_year_cache["checked"] > 86400:
+        _max_year_cache["value"] = date.today().year + 1
+        _max_year_cache["checked"] = time.monotonic()
+    return _max_year_cache["value"]
+
 def validate_ymm(year, make, model):
     """
     Validate Year/Make/Model parameters
@@ -1508,16 +2192,17 @@ def validate_ymm(year, make, model):
     Returns:
         tuple: (bool, str) whether valid and error message if not
     """
-    # Validate year
-    try:
-        year_int = int(year)
-        current_year = datetime.now().year
-        
-        # First cars were made in late 1800s, and we don't want future years
-        if year_int < 1885 or year_int > current_year + 1:
-            return False, f"Year must be between 1885 and {current_year + 1}"
-    except ValueError:
+    # Validate year with a predicate instead of try/except; bad user input
+    # is routine here and raising ValueError is far costlier than isdigit
+    year_str = year.strip() if isinstance(year, str) else str(year)
+    if not year_str.isdigit():
         return False, "Year must be a number"
+
+    year_int = int(year_str)
+    max_year = _max_vehicle_year()
+
+    if year_int < MIN_VEHICLE_YEAR or year_int > max_year:
+        return False, f"Year must be between {MIN_VEHICLE_YEAR} and {max_year}"
     
     # Validate make and model (basic validation - must be non-empty)
     if not make or len(make) < 2:
@@ -1528,7 +2213,7 @@ def validate_ymm(year, make, model):
     
     return True, ""
 
-def get_ymm_valuation(year, make, model, trim=None, **query_params):
+async def get_ymm_valuation(year, make, model, trim=None, validate=True, **query_params):
     """
     Get valuation data for Year/Make/Model from Manheim API.
     
@@ -1537,106 +2222,129 @@ def get_ymm_valuation(year, make, model, trim=None, **query_params):
         make (str): Vehicle manufacturer
         model (str): Vehicle model
         trim (str, optional): Vehicle trim
+        validate (bool): Whether to re-validate the YMM parameters; callers
+            that already ran validate_ymm pass False to skip the second pass
         **query_params: Additional query parameters such as:
             - date (str): Date for historical valuation (YYYY-MM-DD format)
     """
-    # Validate YMM parameters
-    is_valid, error_msg = validate_ymm(year, make, model)
-    if not is_valid:
-        logger.error(f"Invalid YMM parameters: {error_msg} - {year}/{make}/{model}")
-        return None
-        
-    # Validate date parameter
-    if "date" in query_params:
-        date_str = query_params["date"]
-        try:
-            # Check if date is in correct format
-            datetime.strptime(date_str, "%Y-%m-%d")
-            
-            # Check if date is after minimum allowed date (2018-10-08)
-            min_date = datetime.strptime("2018-10-08", "%Y-%m-%d")
-            requested_date = datetime.strptime(date_str, "%Y-%m-%d")
-            
-            if requested_date < min_date:
-                logger.warning(f"Date too early: {date_str}. Must be on or after 2018-10-08")
-                query_params["date"] = None
-                
-            # Check if date is in the future
-            today = datetime.now()
-            if requested_date > today:
-                logger.warning(f"Future date: {date_str}. Must be on or before today's date")
-                query_params["date"] = None
-                
-        except ValueError:
-            logger.warning(f"Invalid date format: {date_str}. Must be in YYYY-MM-DD format")
-            query_params["date"] = None
-    
-    # Get authentication token
-    token = get_manheim_token()
-    if not token:
-        logger.error("Failed to get authentication token")
-        return None
-    
-    # URL parameters are part of the path
-    # URL encode parameters for safety
-    from urllib.parse import quote
-    year_enc = quote(str(year))
-    make_enc = quote(str(make))
-    model_enc = quote(str(model))
-    
-    url = MANHEIM_YMM_URL.format(year=year_enc, make=make_enc, model=model_enc)
-    
+    # Validate parameters unless the caller already did
+    if validate:
+        is_valid, error_msg = validate_ymm(year, make, model)
+        if not is_valid:
+            logger.error("Invalid YMM parameters: %s - %s/%s/%s", error_msg, year, make, model)
+            return None
+
+        # Validate the date parameter with the same parser /vin uses
+        if "date" in query_params:
+            date_value, warning = _parse_date_arg(str(query_params["date"]))
+            if warning:
+                logger.warning("%s", warning)
+            query_params["date"] = date_value
+
     # Query parameters
     params = {}
     if trim:
         params["trim"] = trim
-        
+
     # Add additional query parameters
     for key, value in query_params.items():
         if value is not None:
             params[key] = value
-    
+
+    # Serve repeated queries from the short-TTL cache; popular YMM lookups
+    # are shared across users, so normalize make/model case in the key
+    cache_key = ValuationCache.make_key(
+        "ymm", year, str(make).lower(), str(model).lower(),
+        json.dumps(params, sort_keys=True)
+    )
+    cached = await valuation_cache.get(cache_key)
+    if cached is not None:
+        logger.info("Valuation cache hit for YMM: %s/%s/%s", year, make, model)
+        return cached
+
+    # Coalesce concurrent identical lookups into a single upstream call,
+    # sharing the in-flight registry with the VIN path
+    loop = asyncio.get_running_loop()
+    async with _inflight_lock:
+        existing = _inflight.get(cache_key)
+        if existing is None:
+            _inflight[cache_key] = loop.create_future()
+    if existing is not None:
+        return await existing
+
+    try:
+        data = await _fetch_ymm_valuation(year, make, model, params, cache_key)
+        _inflight[cache_key].set_result(data)
+        return data
+    except BaseException as e:
+        _inflight[cache_key].set_exception(e)
+        raise
+    finally:
+        async with _inflight_lock:
+            _inflight.pop(cache_key, None)
+
+async def _fetch_ymm_valuation(year, make, model, params, cache_key):
+    """Perform the actual Manheim YMM valuation request (singleflight leader)."""
+    # Get authentication token
+    token = await get_manheim_token()
+    if not token:
+        logger.error("Failed to get authentication token")
+        return None
+
+    # URL parameters are part of the path
+    # URL encode parameters for safety
+    year_enc = _quote_path_segment(year)
+    make_enc = _quote_path_segment(make)
+    model_enc = _quote_path_segment(model)
+
+    url = ymm_valuation_url(year_enc, make_enc, model_enc)
+
     headers = {
         "Authorization": f"Bearer {token}",
         "Accept": "application/json"
     }
     
     try:
-        logger.info(f"Fetching valuation data for YMM: {year}/{make}/{model}")
-        response = requests.get(url, headers=headers, params=params, timeout=15)
-        response.raise_for_status()
-        
-        data = response.json()
-        
+        logger.info("Fetching valuation data for YMM: %s/%s/%s", year, make, model)
+        response = await request_with_retry("GET", url, headers=headers, params=params)
+
+        # 404 means no data for this YMM — a routine outcome, not an error
+        status = response.status_code
+        if status == 404:
+            logger.warning("No data found for YMM: %s/%s/%s", year, make, model)
+            return None
+        if status >= 400:
+            logger.error("HTTP error fetching YMM data: %s - %s", status, response.text)
+            return None
+
+        data = json_loads(response.content)
+
         # Validate response data
         if not data:
-            logger.warning(f"Empty response for YMM: {year}/{make}/{model}")
+            logger.warning("Empty response for YMM: %s/%s/%s", year, make, model)
             return None
             
         # Check if the response has the expected structure
         if "vehicle" not in data:
-            logger.warning(f"Unexpected API response format for YMM: {year}/{make}/{model} - missing vehicle data")
+            logger.warning("Unexpected API response format for YMM: %s/%s/%s - missing vehicle data", year, make, model)
         
-        logger.info(f"Successfully retrieved valuation data for YMM: {year}/{make}/{model}")
+        logger.info("Successfully retrieved valuation data for YMM: %s/%s/%s", year, make, model)
+        # Cache only the rendered fields, matching the VIN path; large
+        # unrendered blobs would just inflate the cache's memory footprint
+        await valuation_cache.set(cache_key, trim_valuation(data))
         return data
         
-    except requests.exceptions.Timeout:
-        logger.error(f"Timeout while fetching data for YMM: {year}/{make}/{model}")
+    except httpx.TimeoutException:
+        logger.error("Timeout while fetching data for YMM: %s/%s/%s", year, make, model)
         return None
-    except requests.exceptions.ConnectionError:
-        logger.error(f"Connection error while fetching data for YMM: {year}/{make}/{model}")
-        return None
-    except requests.exceptions.HTTPError as e:
-        if e.response.status_code == 404:
-            logger.warning(f"No data found for YMM: {year}/{make}/{model}")
-            return None
-        logger.error(f"HTTP error fetching YMM data: {e.response.status_code} - {e.response.text}")
+    except httpx.TransportError:
+        logger.error("Connection error while fetching data for YMM: %s/%s/%s", year, make, model)
         return None
-    except json.JSONDecodeError:
-        logger.error(f"Invalid JSON response for YMM: {year}/{make}/{model}")
+    except ValueError:
+        logger.error("Invalid JSON response for YMM: %s/%s/%s", year, make, model)
         return None
     except Exception as e:
-        logger.error(f"Error fetching YMM data: {e}")
+        logger.error("Error fetching YMM data: %s", e)
         return None
 
 async def ymm_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -1652,16 +2360,8 @@ async def ymm_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
 
     # Extract basic YMM parameters first
-    basic_args = []
-    keyword_args = {}
-    
-    for arg in context.args:
-        if '=' in arg:
-            key, value = arg.split('=', 1)
-            keyword_args[key.lower()] = value
-        else:
-            basic_args.append(arg)
-    
+    basic_args, keyword_args = parse_kv_args(context.args)
+
     # We need at least 3 basic args for year, make, model
     if len(basic_args) < 3:
         await update.message.reply_text(
@@ -1690,35 +2390,18 @@ async def ymm_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     # Validate and process keyword arguments
     query_params = {}
     
-    # Process date parameter if present
+    # Process date parameter if present, sharing the validator with /vin;
+    # get_ymm_valuation is called with validate=False so this runs once
     if 'date' in keyword_args:
-        date_value = keyword_args['date']
-        try:
-            # Parse date to validate format
-            requested_date = datetime.strptime(date_value, "%Y-%m-%d")
-            
-            # Check if date is after minimum allowed date (2018-10-08)
-            min_date = datetime.strptime("2018-10-08", "%Y-%m-%d")
-            if requested_date < min_date:
-                await update.message.reply_text(
-                    f"⚠️ *Warning*: Date must be on or after 2018-10-08. Using current date.",
-                    parse_mode="Markdown"
-                )
-            # Check if date is in the future
-            elif requested_date > datetime.now():
-                await update.message.reply_text(
-                    f"⚠️ *Warning*: Date cannot be in the future. Using current date.",
-                    parse_mode="Markdown"
-                )
-            else:
-                query_params['date'] = date_value
-                
-        except ValueError:
+        date_value, warning = _parse_date_arg(keyword_args['date'])
+        if warning:
             await update.message.reply_text(
-                f"⚠️ *Warning*: Invalid date format '{date_value}'. Must be in YYYY-MM-DD format. Using current date.",
+                f"⚠️ *Warning*: {warning}",
                 parse_mode="Markdown"
             )
-    
+        else:
+            query_params['date'] = date_value
+
     # Construct search message
     search_message = f"🔍 *Searching for:* `{year} {make} {model}`"
     if 'date' in query_params:
@@ -1731,7 +2414,7 @@ async def ymm_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     
     try:
         # Get vehicle data from Manheim API
-        data = get_ymm_valuation(year, make, model, **query_params)
+        data = await get_ymm_valuation(year, make, model, validate=False, **query_params)
         
         if not data:
             await update.message.reply_text(
@@ -1744,12 +2427,8 @@ async def ymm_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         message = format_auction_data(data)
         await update.message.reply_text(message, parse_mode="Markdown")
         
-        # Add to history cache
+        # Add the lookup to the user's history (most recent first)
         user_id = update.effective_user.id
-        if user_id not in history_cache:
-            history_cache[user_id] = []
-            
-        # Add the new lookup to the start of the list (most recent first)
         history_entry = {
             'type': 'ymm',
             'query': {
@@ -1757,7 +2436,7 @@ async def ymm_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
                 'make': make,
                 'model': model
             },
-            'data': data,
+            'data': trim_valuation(data),
             'timestamp': datetime.now()
         }
         
@@ -1765,343 +2444,410 @@ async def ymm_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         if 'date' in query_params:
             history_entry['query']['date'] = query_params['date']
             
-        history_cache[user_id].insert(0, history_entry)
-        
-        # Keep only the 10 most recent lookups
-        if len(history_cache[user_id]) > 10:
-            history_cache[user_id].pop()
+        _record_history(user_id, history_entry)
         
     except Exception as e:
-        logger.error(f"Error fetching YMM data: {e}")
+        logger.error("Error fetching YMM data: %s", e)
         await update.message.reply_text(
             f"⚠️ *Error fetching data for {year} {make} {model}*\nPlease try again later.",
             parse_mode="Markdown"
         )
 
-def format_auction_data(data, max_length=None, page=1):
-    """
-    Format the auction data into a readable message based on Manheim Valuations API structure.
-    
-    Args:
-        data (dict): The API response data to format
-        max_length (int, optional): Maximum message length to return (for pagination)
-        page (int, optional): Page number for paginated results
-        
-    Returns:
-        dict: Dictionary containing message parts and pagination info
-    """
-    if not isinstance(data, dict):
-        return {"message": f"🚗 *Vehicle Auction Data*\n\n{str(data)}", "has_more": False, "total_pages": 1}
-    
-    # Main message content
-    message = []
-    message.append("🚗 *Vehicle Auction Data*\n\n")
-    
+# Line templates for the fixed Manheim response shape, compiled once instead
+# of re-assembling the same Markdown skeleton on every format call
+PRICING_TEMPLATE = (
+    "• *{label}:* ${average:,.2f}\n"
+    "  Range: ${below:,.2f} - ${above:,.2f}\n"
+)
+TREND_LINE_TEMPLATE = "• *{period}:* ${price:,.2f}"
+
+def _format_transaction(i, tx):
+    """Render one numbered transaction line (plus detail line) for the summary view."""
+    sale_info = []
+
+    price = tx.get("price")
+    if price is not None:
+        sale_info.append(f"${price:,.2f}")
+
+    sale_date = tx.get("saleDate")
+    if sale_date is not None:
+        sale_info.append(sale_date[:10])  # Date is the first 10 chars of the ISO timestamp
+
+    details = []
+    odometer = tx.get("odometer")
+    if odometer is not None:
+        details.append(f"{odometer:,} miles")
+    grade_value = tx.get("conditionGrade")
+    if grade_value is not None:
+        if isinstance(grade_value, (int, float)):
+            # Handle case where grade is already a decimal or needs conversion from integer (50 = 5.0)
+            if grade_value > 5:  # Likely the 50 = 5.0 format
+                grade_value = grade_value / 10.0
+            details.append(f"Grade: {grade_value:.1f}/5.0")
+        else:
+            details.append(f"Grade: {grade_value}/5.0")
+    location = tx.get("location")
+    if location is not None:
+        details.append(f"{location}")
+
+    if details:
+        return f"*{i}.* {' on '.join(sale_info)}\n   _({' | '.join(details)})_\n"
+    return f"*{i}.* {' on '.join(sale_info)}\n"
+
+def _build_auction_sections(data):
+    """Traverse the payload once and return the formatter's section strings."""
     # Create different sections that can be paginated
     sections = []
-    
+
     # Section 1: Basic vehicle and valuation info
-    section1 = ""
+    section1 = []
     
     # Add valuation date if present
-    if "requestedDate" in data:
-        section1 += f"📅 *Valuation Date:* {data['requestedDate']}\n\n"
-    
-    # Vehicle information
-    if "vehicle" in data:
-        vehicle = data["vehicle"]
-        section1 += "📋 *Vehicle Info*\n"
-        if "year" in vehicle and "make" in vehicle and "model" in vehicle:
-            section1 += f"• *{vehicle.get('year')} {vehicle.get('make')} {vehicle.get('model')}"
-            if "trim" in vehicle:
-                section1 += f" {vehicle.get('trim')}"
-            section1 += "*\n"
-        if "vin" in vehicle:
-            section1 += f"• VIN: `{vehicle.get('vin')}`\n"
-        if "style" in vehicle:
-            section1 += f"• Style: {vehicle.get('style')}\n"
-        if "engineSize" in vehicle:
-            section1 += f"• Engine: {vehicle.get('engineSize')}\n"
-        if "transmission" in vehicle:
-            section1 += f"• Transmission: {vehicle.get('transmission')}\n"
-        if "drivetrain" in vehicle:
-            section1 += f"• Drivetrain: {vehicle.get('drivetrain')}\n"
-        if "subSeries" in vehicle:
-            section1 += f"• SubSeries: {vehicle.get('subSeries')}\n"
-        section1 += "\n"
-    
+    requested_date = data.get("requestedDate")
+    if requested_date is not None:
+        section1.append(f"📅 *Valuation Date:* {requested_date}\n\n")
+
+    # Vehicle information; bind each field once instead of probing the dict
+    # twice per key ("x" in vehicle followed by vehicle.get("x"))
+    vehicle = data.get("vehicle")
+    if vehicle is not None:
+        section1.append("📋 *Vehicle Info*\n")
+        year = vehicle.get("year")
+        make = vehicle.get("make")
+        model = vehicle.get("model")
+        if year is not None and make is not None and model is not None:
+            section1.append(f"• *{year} {make} {model}")
+            trim = vehicle.get("trim")
+            if trim is not None:
+                section1.append(f" {trim}")
+            section1.append("*\n")
+        vin = vehicle.get("vin")
+        if vin is not None:
+            section1.append(f"• VIN: `{vin}`\n")
+        style = vehicle.get("style")
+        if style is not None:
+            section1.append(f"• Style: {style}\n")
+        engine_size = vehicle.get("engineSize")
+        if engine_size is not None:
+            section1.append(f"• Engine: {engine_size}\n")
+        transmission = vehicle.get("transmission")
+        if transmission is not None:
+            section1.append(f"• Transmission: {transmission}\n")
+        drivetrain = vehicle.get("drivetrain")
+        if drivetrain is not None:
+            section1.append(f"• Drivetrain: {drivetrain}\n")
+        sub_series = vehicle.get("subSeries")
+        if sub_series is not None:
+            section1.append(f"• SubSeries: {sub_series}\n")
+        section1.append("\n")
+
     # Current wholesale and retail values
-    if "adjustedPricing" in data:
-        pricing = data["adjustedPricing"]
-        section1 += "💰 *Current Valuation*\n"
-        
+    pricing = data.get("adjustedPricing")
+    if pricing is not None:
+        section1.append("💰 *Current Valuation*\n")
+
         # Wholesale values
-        if "wholesale" in pricing:
-            wholesale = pricing["wholesale"]
-            section1 += f"• *Wholesale Value:* ${wholesale.get('average', 0):,.2f}\n"
-            section1 += f"  Range: ${wholesale.get('below', 0):,.2f} - ${wholesale.get('above', 0):,.2f}\n"
-        
+        wholesale = pricing.get("wholesale")
+        if wholesale is not None:
+            section1.append(PRICING_TEMPLATE.format(
+                label="Wholesale Value",
+                average=wholesale.get('average', 0),
+                below=wholesale.get('below', 0),
+                above=wholesale.get('above', 0)
+            ))
+
         # Retail values
-        if "retail" in pricing:
-            retail = pricing["retail"]
-            section1 += f"• *Retail Value:* ${retail.get('average', 0):,.2f}\n"
-            section1 += f"  Range: ${retail.get('below', 0):,.2f} - ${retail.get('above', 0):,.2f}\n"
-            
+        retail = pricing.get("retail")
+        if retail is not None:
+            section1.append(PRICING_TEMPLATE.format(
+                label="Retail Value",
+                average=retail.get('average', 0),
+                below=retail.get('below', 0),
+                above=retail.get('above', 0)
+            ))
+
         # Adjustment factors
-        if "adjustedBy" in pricing:
-            adjustments = pricing["adjustedBy"]
-            if adjustments and any(adjustments.values()):
-                section1 += "• *Adjusted For:* "
-                factors = []
-                
-                if "Color" in adjustments:
-                    factors.append(f"Color: {adjustments['Color']}")
-                if "Grade" in adjustments:
-                    grade_value = adjustments['Grade']
-                    # Convert grade from integer format (50) to decimal format (5.0)
-                    try:
-                        grade_decimal = float(grade_value) / 10.0
-                        factors.append(f"Grade: {grade_decimal:.1f}")
-                    except (ValueError, TypeError):
-                        factors.append(f"Grade: {grade_value}")
-                if "Odometer" in adjustments:
-                    factors.append(f"Mileage: {int(adjustments['Odometer']):,}")
-                if "Region" in adjustments and adjustments["Region"] != "NA":
-                    factors.append(f"Region: {adjustments['Region']}")
-                    
-                section1 += ", ".join(factors) + "\n"
-        
-        section1 += "\n"
+        adjustments = pricing.get("adjustedBy")
+        if adjustments:
+            factors = []
+
+            color = adjustments.get("Color")
+            if color is not None:
+                factors.append(f"Color: {color}")
+            grade_value = adjustments.get("Grade")
+            if grade_value is not None:
+                # Convert grade from integer format (50) to decimal format (5.0)
+                try:
+                    grade_decimal = float(grade_value) / 10.0
+                    factors.append(f"Grade: {grade_decimal:.1f}")
+                except (ValueError, TypeError):
+                    factors.append(f"Grade: {grade_value}")
+            odometer = adjustments.get("Odometer")
+            if odometer is not None:
+                factors.append(f"Mileage: {int(odometer):,}")
+            region = adjustments.get("Region")
+            if region is not None and region != "NA":
+                factors.append(f"Region: {region}")
+
+            # Emit the line only when something was actually adjusted,
+            # replacing the separate any(adjustments.values()) pre-scan
+            if factors:
+                section1.append("• *Adjusted For:* " + ", ".join(factors) + "\n")
+
+        section1.append("\n")
     
-    sections.append(section1)
+    sections.append("".join(section1))
     
     # Section 2: Historical trends and forecasts
-    section2 = ""
+    section2 = []
     
     # Historical trends
-    if "historicalAverages" in data:
-        history = data["historicalAverages"]
-        section2 += "📈 *Historical Price Trends*\n"
-        
+    history = data.get("historicalAverages")
+    if history is not None:
+        section2.append("📈 *Historical Price Trends*\n")
+
         trend_data = []
-        
-        if "last30days" in history and "price" in history["last30days"]:
-            trend_data.append({
-                "period": "Last 30 Days",
-                "price": history["last30days"].get("price", 0),
-                "odometer": history["last30days"].get("odometer", 0)
-            })
-            
-        if "lastMonth" in history and "price" in history["lastMonth"]:
-            trend_data.append({
-                "period": "Last Month",
-                "price": history["lastMonth"].get("price", 0),
-                "odometer": history["lastMonth"].get("odometer", 0)
-            })
-            
-        if "lastSixMonths" in history and "price" in history["lastSixMonths"]:
-            trend_data.append({
-                "period": "Last 6 Months",
-                "price": history["lastSixMonths"].get("price", 0),
-                "odometer": history["lastSixMonths"].get("odometer", 0)
-            })
-            
-        if "lastYear" in history and "price" in history["lastYear"]:
-            trend_data.append({
-                "period": "Last Year",
-                "price": history["lastYear"].get("price", 0),
-                "odometer": history["lastYear"].get("odometer", 0)
-            })
-            
+
+        for key, period in (("last30days", "Last 30 Days"), ("lastMonth", "Last Month"),
+                            ("lastSixMonths", "Last 6 Months"), ("lastYear", "Last Year")):
+            entry = history.get(key)
+            if entry is not None and "price" in entry:
+                trend_data.append({
+                    "period": period,
+                    "price": entry.get("price", 0),
+                    "odometer": entry.get("odometer", 0)
+                })
+
         # Show historical data
         for item in trend_data:
-            section2 += f"• *{item['period']}:* ${item['price']:,.2f}"
+            section2.append(TREND_LINE_TEMPLATE.format(period=item['period'], price=item['price']))
             if item['odometer']:
-                section2 += f" @ {item['odometer']:,} miles\n"
+                section2.append(f" @ {item['odometer']:,} miles\n")
             else:
-                section2 += "\n"
+                section2.append("\n")
                 
-        section2 += "\n"
+        section2.append("\n")
     
     # Forecast data
-    if "forecast" in data:
-        forecast = data["forecast"]
-        section2 += "🔮 *Price Forecast*\n"
-        
-        if "nextMonth" in forecast:
-            section2 += "• *Next Month:*\n"
-            if "wholesale" in forecast["nextMonth"]:
-                section2 += f"  Wholesale: ${forecast['nextMonth']['wholesale']:,.2f}\n"
-            if "retail" in forecast["nextMonth"]:
-                section2 += f"  Retail: ${forecast['nextMonth']['retail']:,.2f}\n"
-                
-        if "nextYear" in forecast:
-            section2 += "• *Next Year:*\n"
-            if "wholesale" in forecast["nextYear"]:
-                section2 += f"  Wholesale: ${forecast['nextYear']['wholesale']:,.2f}\n"
-            if "retail" in forecast["nextYear"]:
-                section2 += f"  Retail: ${forecast['nextYear']['retail']:,.2f}\n"
-                
-        section2 += "\n"
+    forecast = data.get("forecast")
+    if forecast is not None:
+        section2.append("🔮 *Price Forecast*\n")
+
+        next_month = forecast.get("nextMonth")
+        if next_month is not None:
+            section2.append("• *Next Month:*\n")
+            wholesale = next_month.get("wholesale")
+            if wholesale is not None:
+                section2.append(f"  Wholesale: ${wholesale:,.2f}\n")
+            retail = next_month.get("retail")
+            if retail is not None:
+                section2.append(f"  Retail: ${retail:,.2f}\n")
+
+        next_year = forecast.get("nextYear")
+        if next_year is not None:
+            section2.append("• *Next Year:*\n")
+            wholesale = next_year.get("wholesale")
+            if wholesale is not None:
+                section2.append(f"  Wholesale: ${wholesale:,.2f}\n")
+            retail = next_year.get("retail")
+            if retail is not None:
+                section2.append(f"  Retail: ${retail:,.2f}\n")
+
+        section2.append("\n")
     
-    sections.append(section2)
+    sections.append("".join(section2))
     
     # Section 3: Summary statistics
-    section3 = ""
+    section3 = []
     
     # Sample size and accuracy indicators
-    if "sampleSize" in data:
-        section3 += f"• *Sample Size:* {data['sampleSize']} transactions\n"
-    if "extendedCoverage" in data and data["extendedCoverage"]:
-        section3 += "• Note: Uses Small Sample Size\n"
-    if "bestMatch" in data and data["bestMatch"]:
-        section3 += "• *Best Match* found for this VIN\n\n"
-    
-    # Market statistics
-    if "marketSummary" in data and "statistics" in data["marketSummary"]:
-        stats = data["marketSummary"]["statistics"]
-        section3 += "📊 *Market Summary*\n"
-        
-        if "averagePrice" in stats:
-            section3 += f"• *Avg Price:* ${stats.get('averagePrice', 0):,.2f}\n"
-        if "averageOdometer" in stats:
-            section3 += f"• *Avg Mileage:* {stats.get('averageOdometer', 0):,} miles\n"
-        if "averageConditionGrade" in stats:
-            grade_value = stats.get('averageConditionGrade', 0)
+    sample_size = data.get("sampleSize")
+    if sample_size is not None:
+        section3.append(f"• *Sample Size:* {sample_size} transactions\n")
+    if data.get("extendedCoverage"):
+        section3.append("• Note: Uses Small Sample Size\n")
+    if data.get("bestMatch"):
+        section3.append("• *Best Match* found for this VIN\n\n")
+
+    # Market statistics; resolve marketSummary once for this and the
+    # transactions section below
+    market = data.get("marketSummary") or {}
+    stats = market.get("statistics")
+    if stats is not None:
+        section3.append("📊 *Market Summary*\n")
+
+        avg_price = stats.get("averagePrice")
+        if avg_price is not None:
+            section3.append(f"• *Avg Price:* ${avg_price:,.2f}\n")
+        avg_odometer = stats.get("averageOdometer")
+        if avg_odometer is not None:
+            section3.append(f"• *Avg Mileage:* {avg_odometer:,} miles\n")
+        grade_value = stats.get("averageConditionGrade")
+        if grade_value is not None:
             if grade_value > 5:  # Convert from integer format (50 = 5.0)
                 grade_value = grade_value / 10.0
-            section3 += f"• *Avg Condition:* {grade_value:.1f}/5.0\n"
-        if "transactionCount" in stats:
-            section3 += f"• *Total Transactions:* {stats.get('transactionCount', 0)}\n\n"
+            section3.append(f"• *Avg Condition:* {grade_value:.1f}/5.0\n")
+        tx_count = stats.get("transactionCount")
+        if tx_count is not None:
+            section3.append(f"• *Total Transactions:* {tx_count}\n\n")
     
-    sections.append(section3)
+    sections.append("".join(section3))
     
     # Section 4: Recent transactions
-    section4 = ""
+    section4 = []
     
     # Recent auction transactions
-    if "marketSummary" in data and "transactions" in data["marketSummary"]:
-        transactions = data["marketSummary"]["transactions"]
-        if transactions:
-            # Store transactions for potential detailed view
-            data["transaction_count"] = len(transactions)
-            
-            section4 += f"🔄 *Recent Transactions* ({len(transactions)} total)\n"
-            for i, tx in enumerate(transactions[:3], 1):  # Show only 3 in the summary view
-                sale_info = []
-                
-                if "price" in tx:
-                    sale_info.append(f"${tx.get('price', 0):,.2f}")
-                
-                if "saleDate" in tx:
-                    sale_date = tx.get('saleDate', '').split('T')[0]  # Format ISO date
-                    sale_info.append(f"{sale_date}")
-                
-                section4 += f"*{i}.* {' on '.join(sale_info)}\n"
-                
-                details = []
-                if "odometer" in tx:
-                    details.append(f"{tx.get('odometer', 0):,} miles")
-                if "conditionGrade" in tx:
-                    grade_value = tx.get('conditionGrade', 'N/A')
-                    if isinstance(grade_value, (int, float)):
-                        # Handle case where grade is already a decimal or needs conversion from integer (50 = 5.0)
-                        if grade_value > 5:  # Likely the 50 = 5.0 format
-                            grade_value = grade_value / 10.0
-                        details.append(f"Grade: {grade_value:.1f}/5.0")
-                    else:
-                        details.append(f"Grade: {grade_value}/5.0")
-                if "location" in tx:
-                    details.append(f"{tx.get('location', 'N/A')}")
-                
-                if details:
-                    section4 += f"   _({' | '.join(details)})_\n"
-                
-            section4 += "\n"
-            
-            # Add note about viewing all transactions if there are more than shown
-            if len(transactions) > 3:
-                section4 += f"_...and {len(transactions) - 3} more transactions. Use the button below to view all._\n\n"
-    
-    sections.append(section4)
+    transactions = market.get("transactions")
+    if transactions:
+        tx_total = len(transactions)
+        section4.append(f"🔄 *Recent Transactions* ({tx_total} total)\n")
+        # Show only 3 in the summary view
+        section4.append("".join(
+            _format_transaction(i, tx) for i, tx in enumerate(transactions[:3], 1)
+        ))
+        section4.append("\n")
+
+        # Add note about viewing all transactions if there are more than shown
+        if tx_total > 3:
+            section4.append(f"_...and {tx_total - 3} more transactions. Use the button below to view all._\n\n")
     
+    sections.append("".join(section4))
+
+    return sections
+
+def _section_offsets(lens, total_pages):
+    """Prefix-sum section offsets, shifted by the page-1 header length."""
+    header_base = len(f"🚗 *Vehicle Auction Data* (Page 1/{total_pages})\n\n")
+    return list(accumulate(lens, initial=header_base))
+
+def _slice_auction_page(sections, max_length, page, total_pages, offsets):
+    """Assemble one page dict from prebuilt section strings and offsets."""
+    # Add pagination header; accumulate page content in a list and
+    # join once rather than concatenating strings
+    header = f"🚗 *Vehicle Auction Data* (Page {page}/{total_pages})\n\n"
+    page_parts = [header]
+    page_length = len(header)
+
+    if page == 1:
+        # First page always includes basic info
+        for section in sections:
+            if page_length + len(section) <= max_length:
+                page_parts.append(section)
+                page_length += len(section)
+            else:
+                break
+    else:
+        # For other pages, skip content that lands on earlier pages. The
+        # precomputed prefix sums let us jump straight to the first section
+        # touching the requested page instead of rescanning earlier ones.
+        page_start = (page - 1) * max_length
+        page_end = page * max_length
+        first = max(0, bisect_right(offsets, page_start) - 1)
+
+        for idx in range(first, len(sections)):
+            section = sections[idx]
+            cumulative_length = offsets[idx]
+
+            # Extract the portion of this section that belongs on this page
+            start_offset = max(0, page_start - cumulative_length)
+            end_offset = min(len(section), page_end - cumulative_length)
+
+            if start_offset < end_offset:
+                page_parts.append(section[start_offset:end_offset])
+
+            # If we've filled this page, stop
+            if offsets[idx + 1] >= page_end:
+                break
+
+    return {
+        "message": "".join(page_parts),
+        "has_more": page < total_pages,
+        "total_pages": total_pages,
+        "current_page": page
+    }
+
+def format_auction_data(data, max_length=None, page=1):
+    """
+    Format the auction data into a readable message based on Manheim Valuations API structure.
+
+    Args:
+        data (dict): The API response data to format
+        max_length (int, optional): Maximum message length to return (for pagination)
+        page (int, optional): Page number for paginated results
+
+    Returns:
+        dict: Dictionary containing message parts and pagination info
+    """
+    if not isinstance(data, dict):
+        return {"message": f"🚗 *Vehicle Auction Data*\n\n{str(data)}", "has_more": False, "total_pages": 1}
+
+    sections = _build_auction_sections(data)
+
     # Handle pagination if requested
     if max_length is not None:
-        total_length = sum(len(s) for s in sections)
+        lens = [len(s) for s in sections]
+        total_length = sum(lens)
         total_pages = (total_length + max_length - 1) // max_length
-        
+
         if page < 1:
             page = 1
         elif page > total_pages:
             page = total_pages
-        
+
         # If we need pagination, build message differently
         if total_pages > 1:
-            # Add pagination header
-            current_message = f"🚗 *Vehicle Auction Data* (Page {page}/{total_pages})\n\n"
-            
-            # Calculate which sections to include based on page
-            remaining_length = max_length - len(current_message)
-            message_parts = []
-            
-            if page == 1:
-                # First page always includes basic info
-                for section in sections:
-                    if len(current_message) + len(section) <= max_length:
-                        current_message += section
-                    else:
-                        break
-            else:
-                # For other pages, need to skip content that would be on earlier pages
-                cumulative_length = len(f"🚗 *Vehicle Auction Data* (Page 1/{total_pages})\n\n")
-                
-                for section in sections:
-                    section_length = len(section)
-                    
-                    # If adding this section would put us on a page before the requested page,
-                    # skip to the next section
-                    if cumulative_length + section_length <= (page - 1) * max_length:
-                        cumulative_length += section_length
-                        continue
-                    
-                    # If this section spans the current page
-                    start_offset = max(0, (page - 1) * max_length - cumulative_length)
-                    end_offset = min(section_length, page * max_length - cumulative_length)
-                    
-                    if start_offset < end_offset:
-                        # Extract the portion of this section that belongs on this page
-                        section_part = section[start_offset:end_offset]
-                        current_message += section_part
-                    
-                    cumulative_length += section_length
-                    
-                    # If we've filled this page, stop
-                    if cumulative_length >= page * max_length:
-                        break
-            
-            return {
-                "message": current_message, 
-                "has_more": page < total_pages, 
-                "total_pages": total_pages,
-                "current_page": page
-            }
-        
+            offsets = _section_offsets(lens, total_pages)
+            return _slice_auction_page(sections, max_length, page, total_pages, offsets)
+
     # If no pagination or just one page, combine all sections
-    full_message = "".join(message) + "".join(sections)
-    
+    full_message = "🚗 *Vehicle Auction Data*\n\n" + "".join(sections)
+
     return {
-        "message": full_message, 
-        "has_more": False, 
+        "message": full_message,
+        "has_more": False,
         "total_pages": 1,
         "current_page": 1
     }
 
+def format_auction_data_pages(data, max_length):
+    """
+    Build every page of a paginated reply in one traversal of the payload.
+
+    Unlike calling format_auction_data per page, the sections are built once
+    and only the cheap slicing runs per page.
+
+    Returns:
+        list: Page dicts in page order; single-page responses yield one entry.
+    """
+    if not isinstance(data, dict):
+        return [format_auction_data(data, max_length)]
+
+    sections = _build_auction_sections(data)
+    lens = [len(s) for s in sections]
+    total_length = sum(lens)
+    total_pages = max(1, (total_length + max_length - 1) // max_length)
+
+    if total_pages == 1:
+        return [{
+            "message": "🚗 *Vehicle Auction Data*\n\n" + "".join(sections),
+            "has_more": False,
+            "total_pages": 1,
+            "current_page": 1
+        }]
+
+    offsets = _section_offsets(lens, total_pages)
+    return [
+        _slice_auction_page(sections, max_length, page, total_pages, offsets)
+        for page in range(1, total_pages + 1)
+    ]
+
 async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Display user's search history."""
     user_id = update.effective_user.id
     
-    # Check if user has any history
-    if user_id not in history_cache or not history_cache[user_id]:
+    # Check if user has any history (lazily reloaded from sqlite if needed)
+    history = _user_history(user_id)
+    if not history:
         await update.message.reply_text(
             "📭 *No search history found*\n\n"
             "Try searching for a VIN or Year/Make/Model first.",
@@ -2117,7 +2863,6 @@ async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             filter_type = filter_arg.lower()
     
     # Filter history based on argument if provided
-    history = history_cache[user_id]
     if filter_type:
         history = [item for item in history if item['type'] == filter_type]
         
@@ -2198,61 +2943,95 @@ async def history_command(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
 def main() -> None:
     """Start the bot."""
+    # Use uvloop for the event loop when available
+    if uvloop:
+        uvloop.install()
+        logger.info("Using uvloop event loop")
+
     # Check if the Telegram token is configured
     if not os.getenv("TELEGRAM_BOT_TOKEN"):
         logger.error("TELEGRAM_BOT_TOKEN environment variable is not set. Please configure it in your .env file.")
-        print("Error: Telegram bot token not configured. Please check your .env file.")
         return
         
-    # Create the Application and pass it your bot's token
+    # Create the Application and pass it your bot's token. Concurrent
+    # update processing stops one slow lookup from stalling other chats;
+    # per-user read-modify-write is already serialized via sessions.lock
+    # and the conversation flow is ordered by the ConversationHandler.
     try:
-        application = ApplicationBuilder().token(os.getenv("TELEGRAM_BOT_TOKEN")).build()
+        application = (
+            ApplicationBuilder()
+            .token(os.getenv("TELEGRAM_BOT_TOKEN"))
+            .concurrent_updates(True)
+            # Outbound bursts (paged replies, transaction dumps) reuse
+            # pooled HTTP/2 connections instead of re-handshaking, and
+            # getUpdates keeps its own small pool so polling never waits
+            # behind a send burst
+            .http_version("2")
+            .connection_pool_size(256)
+            .pool_timeout(1.0)
+            .get_updates_connection_pool_size(8)
+            .build()
+        )
     except Exception as e:
-        logger.error(f"Failed to create Telegram bot: {e}")
-        print(f"Error: Could not initialize the Telegram bot: {e}")
+        logger.error("Failed to create Telegram bot: %s", e)
         return
 
     # Add conversation handler for the interactive refinement process
     refinement_conv_handler = ConversationHandler(
-        entry_points=[CallbackQueryHandler(refine_valuation_callback, pattern="^refine_valuation$")],
+        entry_points=[CallbackQueryHandler(refine_valuation_callback, pattern=CB_REFINE)],
         states={
-            CHOOSING_COLOR: [CallbackQueryHandler(color_callback, pattern="^color_")],
-            CHOOSING_GRADE: [CallbackQueryHandler(grade_callback, pattern="^grade_")],
-            CHOOSING_ODOMETER: [CallbackQueryHandler(odometer_callback, pattern="^odometer_")],
-            CHOOSING_REGION: [CallbackQueryHandler(region_callback, pattern="^region_")],
+            CHOOSING_COLOR: [CallbackQueryHandler(color_callback, pattern=CB_COLOR)],
+            CHOOSING_GRADE: [CallbackQueryHandler(grade_callback, pattern=CB_GRADE)],
+            CHOOSING_ODOMETER: [CallbackQueryHandler(odometer_callback, pattern=CB_ODOMETER)],
+            CHOOSING_REGION: [CallbackQueryHandler(region_callback, pattern=CB_REGION)],
         },
-        fallbacks=[CallbackQueryHandler(cancel_callback, pattern="^cancel$")],
+        fallbacks=[CallbackQueryHandler(cancel_callback, pattern=CB_CANCEL)],
+        conversation_timeout=600,  # drop abandoned refinement flows after 10 minutes
     )
 
-    # Add command handlers
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("help", help_command))
-    application.add_handler(CommandHandler("vin", vin_command))
-    application.add_handler(CommandHandler("ymm", ymm_command))
-    application.add_handler(CommandHandler("history", history_command))
-    
-    # Add callback handlers
-    application.add_handler(CallbackQueryHandler(view_all_transactions_callback, pattern="^view_all_transactions"))
-    application.add_handler(CallbackQueryHandler(page_navigation_callback, pattern="^page:"))
-    application.add_handler(CallbackQueryHandler(generate_chart_callback, pattern="^generate_chart:"))
-    application.add_handler(refinement_conv_handler)
+    # Register command and callback handlers in one bulk call
+    application.add_handlers([
+        CommandHandler("start", start),
+        CommandHandler("help", help_command),
+        CommandHandler("vin", vin_command),
+        CommandHandler("ymm", ymm_command),
+        CommandHandler("history", history_command),
+        CallbackQueryHandler(view_all_transactions_callback, pattern=CB_VIEW_TRANSACTIONS),
+        CallbackQueryHandler(page_navigation_callback, pattern=CB_PAGE),
+        CallbackQueryHandler(generate_chart_callback, pattern=CB_CHART),
+        refinement_conv_handler,
+    ])
+
+    # The handlers only consume plain messages and inline-button presses;
+    # asking Telegram for just these skips shipping and deserializing the
+    # update categories the bot would ignore anyway
+    allowed_updates = ["message", "callback_query"]
 
     try:
-        # Start the Bot
-        logger.info("Starting Manheim Telegram Bot")
-        print("Starting Manheim Telegram Bot...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        # Start the Bot. With WEBHOOK_URL set, updates are pushed to us
+        # instead of running the continuous getUpdates polling cycle
+        webhook_url = os.getenv("WEBHOOK_URL")
+        if webhook_url:
+            token = os.getenv("TELEGRAM_BOT_TOKEN")
+            port = int(os.getenv("PORT", "8443"))
+            logger.info("Starting Manheim Telegram Bot (webhook mode)")
+            application.run_webhook(
+                listen="0.0.0.0",
+                port=port,
+                url_path=token,
+                webhook_url=f"{webhook_url.rstrip('/')}/{token}",
+                allowed_updates=allowed_updates
+            )
+        else:
+            logger.info("Starting Manheim Telegram Bot")
+            application.run_polling(allowed_updates=allowed_updates)
     except Exception as e:
-        logger.error(f"Error while running the bot: {e}")
-        print(f"Error: Bot crashed: {e}")
+        logger.error("Error while running the bot: %s", e)
 
 if __name__ == '__main__':
     try:
         main()
     except KeyboardInterrupt:
         logger.info("Bot stopped by user")
-        print("\nBot stopped by user. Goodbye!")
     except Exception as e:
-        logger.critical(f"Unhandled exception: {e}", exc_info=True)
-        print(f"\nCritical error: {e}")
-        print("Check logs for more details.")
\ No newline at end of file
+        logger.critical("Unhandled exception: %s", e, exc_info=True)
\ No newline at end of file